@@ -0,0 +1,215 @@
+# Бенчмарки запросов из database/requests.py на синтетических данных.
+#
+# Запуск (pytest-benchmark не входит в зависимости бота):
+#     python -m pytest bench/benchmark_requests.py
+#     BENCH_SCALES=tasks10,tasks1k,tasks100k,users10k python -m pytest bench/benchmark_requests.py
+#
+# Базовая линия и проверка регрессий:
+#     python -m pytest bench/benchmark_requests.py --benchmark-autosave
+#     python -m pytest bench/benchmark_requests.py --benchmark-compare
+# Последняя команда падает, если медиана хоть одного замера выросла больше чем на
+# BENCH_MAX_REGRESSION процентов (20 по умолчанию, см. bench/conftest.py).
+import asyncio
+import inspect
+import os
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+pytest.importorskip("pytest_benchmark")
+
+from bench.seed import BENCH_USER, SCALES, seed_database
+from bot.handlers import format_tasks_list
+from database import requests
+from database.models import Task, build_engine, setup_schema
+from database.requests import (archive_completed_tasks, complete_task, complete_tasks, create_category,
+                               create_task, delete_task, delete_tasks, ensure_user, get_category_task_counts,
+                               get_or_create_user, get_statistics, get_task_history, get_tasks_by_category,
+                               get_tasks_for_today, get_tasks_for_week, get_tasks_in_range, get_tasks_page,
+                               get_upcoming_deadlines, get_user_categories, get_user_tasks, mark_reminder_sent,
+                               search_tasks, TASK_LIST_ORDER)
+
+BENCH_SCALES = os.getenv("BENCH_SCALES", "tasks10,tasks1k").split(",")
+# у записи каждый раунд меняет данные, поэтому раундов немного и они фиксированы
+WRITE_ROUNDS = 50
+# служебные функции без обращения к данным
+NOT_BENCHMARKED = {"disable_write_batching"}
+READ_MODEL_ROWS = 1_000
+
+
+class BenchDatabase:
+    def __init__(self, loop: asyncio.AbstractEventLoop, session_pool: async_sessionmaker):
+        self.loop = loop
+        self.session_pool = session_pool
+
+    def run(self, function, *args, **kwargs):
+        # как в обработчике: своя сессия на каждый вызов
+        async def call():
+            async with self.session_pool() as session:
+                return await function(*args, session=session, **kwargs)
+        return self.loop.run_until_complete(call())
+
+    def new_task_ids(self, count: int = 1):
+        return [self.run(create_task, BENCH_USER, f"Временная задача {index}").id for index in range(count)]
+
+
+@pytest.fixture(scope="module", params=BENCH_SCALES)
+def db(request, tmp_path_factory):
+    scale = SCALES[request.param]
+    loop = asyncio.new_event_loop()
+    engine = build_engine(f"sqlite+aiosqlite:///{tmp_path_factory.mktemp(request.param) / 'bench.sqlite3'}")
+
+    async def prepare():
+        async with engine.begin() as conn:
+            await conn.run_sync(setup_schema)
+        await seed_database(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False), scale)
+
+    loop.run_until_complete(prepare())
+    requests._known_users.clear()
+    yield BenchDatabase(loop, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+def test_every_request_is_benchmarked():
+    functions = {name for name, function in vars(requests).items()
+                 if inspect.iscoroutinefunction(function) and not name.startswith("_")
+                 and function.__module__ == requests.__name__}
+    benchmarked = {name[len("test_"):] for name in globals() if name.startswith("test_")}
+    assert functions - NOT_BENCHMARKED <= benchmarked
+
+
+def test_get_user_tasks(benchmark, db):
+    benchmark(db.run, get_user_tasks, BENCH_USER)
+
+
+def test_get_tasks_page(benchmark, db):
+    benchmark(db.run, get_tasks_page, BENCH_USER)
+
+
+def test_search_tasks(benchmark, db):
+    benchmark(db.run, search_tasks, BENCH_USER, "купить молоко")
+
+
+def test_get_tasks_in_range(benchmark, db):
+    start = datetime.now()
+    benchmark(db.run, get_tasks_in_range, BENCH_USER, start, start + timedelta(days=3))
+
+
+def test_get_tasks_for_today(benchmark, db):
+    benchmark(db.run, get_tasks_for_today, BENCH_USER)
+
+
+def test_get_tasks_for_week(benchmark, db):
+    benchmark(db.run, get_tasks_for_week, BENCH_USER)
+
+
+def test_get_upcoming_deadlines(benchmark, db):
+    start = datetime.now()
+    benchmark(db.run, get_upcoming_deadlines, start, start + timedelta(minutes=15))
+
+
+def test_get_statistics(benchmark, db):
+    benchmark(db.run, get_statistics, BENCH_USER)
+
+
+def test_get_statistics_counters(benchmark, db):
+    benchmark(db.run, get_statistics, BENCH_USER, with_categories=False)
+
+
+def test_get_task_history(benchmark, db):
+    benchmark(db.run, get_task_history, BENCH_USER)
+
+
+def test_get_user_categories(benchmark, db):
+    benchmark(db.run, get_user_categories, BENCH_USER)
+
+
+def test_get_category_task_counts(benchmark, db):
+    benchmark(db.run, get_category_task_counts, BENCH_USER)
+
+
+def test_get_tasks_by_category(benchmark, db):
+    benchmark(db.run, get_tasks_by_category, BENCH_USER, "Работа")
+
+
+def test_get_or_create_user(benchmark, db):
+    benchmark(db.run, get_or_create_user, BENCH_USER)
+
+
+def test_ensure_user(benchmark, db):
+    async def call(session: AsyncSession):
+        await ensure_user(session, BENCH_USER)
+    benchmark(db.run, call)
+
+
+def test_create_category(benchmark, db):
+    benchmark(db.run, create_category, BENCH_USER, "Работа")
+
+
+def test_create_task(benchmark, db):
+    benchmark.pedantic(db.run, args=(create_task, BENCH_USER, "Новая задача"),
+                       kwargs={"description": "Описание", "category": "Дом", "priority": 3},
+                       rounds=WRITE_ROUNDS)
+
+
+def test_complete_task(benchmark, db):
+    benchmark.pedantic(db.run, setup=lambda: ((complete_task, BENCH_USER, *db.new_task_ids()), {}),
+                       rounds=WRITE_ROUNDS)
+
+
+def test_complete_tasks(benchmark, db):
+    benchmark.pedantic(db.run, setup=lambda: ((complete_tasks, BENCH_USER, db.new_task_ids(10)), {}),
+                       rounds=WRITE_ROUNDS)
+
+
+def test_delete_task(benchmark, db):
+    benchmark.pedantic(db.run, setup=lambda: ((delete_task, BENCH_USER, *db.new_task_ids()), {}),
+                       rounds=WRITE_ROUNDS)
+
+
+def test_delete_tasks(benchmark, db):
+    benchmark.pedantic(db.run, setup=lambda: ((delete_tasks, BENCH_USER, db.new_task_ids(10)), {}),
+                       rounds=WRITE_ROUNDS)
+
+
+def test_mark_reminder_sent(benchmark, db):
+    benchmark.pedantic(db.run, setup=lambda: ((mark_reminder_sent, *db.new_task_ids()), {}),
+                       rounds=WRITE_ROUNDS)
+
+
+def test_archive_completed_tasks(benchmark, db):
+    # архивировать нечего: замеряется проход архиватора по уже чистой базе, как в большинстве его запусков
+    benchmark(lambda: db.loop.run_until_complete(
+        archive_completed_tasks(timedelta(days=3650), session_pool=db.session_pool)))
+
+
+def test_format_tasks_list(benchmark, db):
+    tasks = db.run(get_user_tasks, BENCH_USER, limit=1000)
+    benchmark(format_tasks_list, tasks)
+
+
+async def load_orm_tasks(tg_id: int, limit: int, session: AsyncSession):
+    # прежний путь чтения списка: полные объекты Task, категория через joined-relationship
+    result = await session.execute(
+        select(Task).where(and_(Task.user_id == tg_id, Task.is_completed == False))
+        .order_by(*TASK_LIST_ORDER).limit(limit)
+    )
+    return result.scalars().all()
+
+
+@pytest.mark.parametrize("loader", ["orm", "rows"])
+def test_read_model(benchmark, db, loader):
+    # сравнение ORM-объектов и TaskRow на списке до 1000 задач: время и пик памяти на одну загрузку
+    load = {"orm": load_orm_tasks, "rows": get_user_tasks}[loader]
+    tracemalloc.start()
+    tasks = db.run(load, BENCH_USER, limit=READ_MODEL_ROWS)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    benchmark.extra_info["rows"] = len(tasks)
+    benchmark.extra_info["peak_kib"] = round(peak / 1024)
+    benchmark(db.run, load, BENCH_USER, limit=READ_MODEL_ROWS)
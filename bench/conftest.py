@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+# порог регрессии относительно сохраненной базовой линии, в процентах от медианы
+BENCH_MAX_REGRESSION = int(os.getenv("BENCH_MAX_REGRESSION", 20))
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # --benchmark-compare без своего --benchmark-compare-fail сравнивает с порогом по умолчанию
+    option = config.option
+    if getattr(option, "benchmark_compare", None) and not getattr(option, "benchmark_compare_fail", None):
+        from pytest_benchmark.utils import parse_compare_fail
+        option.benchmark_compare_fail = [parse_compare_fail(f"median:{BENCH_MAX_REGRESSION}%")]
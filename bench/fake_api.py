@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'UnderCtrl', 'username': 'underctrl_bench_bot'}
+
+
+# локальная замена Bot API: getUpdates отдает то, что положил генератор нагрузки,
+# а все исходящие вызовы бота складываются в очередь чата, откуда их ждет симулированный пользователь
+class FakeBotAPI:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Condition()
+        self._outbox: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        # при port=0 порт выбирает система
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def push_update(self, update: Dict[str, Any]) -> int:
+        update_id = next(self._update_ids)
+        async with self._new_updates:
+            self._updates.append({'update_id': update_id, **update})
+            self._new_updates.notify_all()
+        return update_id
+
+    async def wait_for(self, chat_id: int, method: str = 'sendMessage', timeout: float = 30) -> Dict[str, Any]:
+        queue = self._outbox[chat_id]
+        while True:
+            call_method, payload = await asyncio.wait_for(queue.get(), timeout=timeout)
+            if call_method == method:
+                return payload
+
+    def message(self, chat_id: int, text: str) -> Dict[str, Any]:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        payload = dict(await request.post())
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return self._ok(await self._get_updates(payload))
+        if method == 'getMe':
+            return self._ok(BOT_USER)
+
+        chat_id = payload.get('chat_id')
+        if chat_id is not None:
+            self._outbox[int(chat_id)].put_nowait((method, payload))
+        elif method == 'answerCallbackQuery':
+            # у answerCallbackQuery нет chat_id, в id запроса генератор кладет id пользователя
+            self._outbox[int(payload['callback_query_id'].split(':')[0])].put_nowait((method, payload))
+
+        if method in ('sendMessage', 'editMessageText'):
+            return self._ok(self.message(int(chat_id), payload.get('text', '')))
+        return self._ok(True)
+
+    async def _get_updates(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(payload.get('offset') or 0)
+        timeout = float(payload.get('timeout') or 0)
+        async with self._new_updates:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return list(self._updates)
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.Response(text=json.dumps({'ok': True, 'result': result}), content_type='application/json')
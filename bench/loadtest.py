@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import tempfile
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bench.fake_api import FakeBotAPI
+from bot.bot import build_dispatcher, release_routers
+from bot.outbound import OutboundScheduler, ThrottledSession
+from bot.storage import SQLiteStorage
+from database.models import build_engine, setup_schema
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+FIRST_USER_ID = 10_000_000
+
+# какой обработчик должен ответить на апдейт; по нему группируются задержки и SQL-запросы.
+# В переменной лежит изменяемый список: фоновые задачи, запущенные из обработчика (сброс FSM),
+# копируют контекст, и после завершения апдейта их запросы должны считаться фоновыми
+_current_handler: ContextVar[Optional[list]] = ContextVar('loadtest_handler', default=None)
+
+BACKGROUND = 'background'
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    def attach(self, engine):
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._before)
+        event.listen(engine.sync_engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('loadtest_started', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['loadtest_started'].pop()
+        label = _current_handler.get()
+        handler = label[0] if label and label[0] else BACKGROUND
+        self.queries[handler] += 1
+        self.seconds[handler] += time.perf_counter() - started
+
+
+class SimulatedUser:
+    def __init__(self, api: FakeBotAPI, user_id: int, samples: Dict[str, List[float]],
+                 labels: Dict[int, str], rng: random.Random):
+        self.api = api
+        self.user_id = user_id
+        self.samples = samples
+        self.labels = labels
+        self.rng = rng
+        self._callbacks = itertools.count(1)
+        self.chat = {'id': user_id, 'type': 'private'}
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+
+    async def send_text(self, handler: str, text: str):
+        await self._step(handler, {'message': {
+            'message_id': self.rng.randrange(1, 2 ** 31),
+            'date': int(time.time()),
+            'chat': self.chat,
+            'from': self.user,
+            'text': text,
+        }})
+
+    async def tap(self, handler: str, data: str):
+        await self._step(handler, {'callback_query': {
+            'id': f'{self.user_id}:{next(self._callbacks)}',
+            'from': self.user,
+            'chat_instance': str(self.user_id),
+            'message': self.api.message(self.user_id, '...'),
+            'data': data,
+        }})
+
+    async def _step(self, handler: str, update: Dict[str, Any]):
+        started = time.perf_counter()
+        update_id = await self.api.push_update(update)
+        self.labels[update_id] = handler
+        await self.api.wait_for(self.user_id)
+        self.samples[handler].append(time.perf_counter() - started)
+
+    async def run(self, iterations: int):
+        for iteration in range(iterations):
+            # сценарий создания задачи из CreateTask, затем список задач и статистика
+            await self.send_text('add_tasks_button', 'Добавить задачу')
+            await self.send_text('add_name', f'Задача {iteration}')
+            await self.send_text('add_description', 'Описание задачи для нагрузочного теста')
+            if self.rng.random() < 0.5:
+                await self.send_text('add_category', f'Категория {self.rng.randrange(3)}')
+            else:
+                await self.tap('skip_category', 'skip_category')
+            await self.tap('set_priority', f"priority_{self.rng.choice(['low', 'medium', 'high'])}")
+            if self.rng.random() < 0.5:
+                deadline = datetime.now() + timedelta(hours=self.rng.randrange(1, 72))
+                await self.send_text('add_deadline', deadline.strftime('%d-%m-%Y %H:%M:%S'))
+            else:
+                await self.tap('skip_deadline', 'skip_deadline')
+            await self.tap('save_task_handler', 'save_task')
+            await self.send_text('list_tasks', 'Список задач')
+            await self.tap('stats_inline', 'stats')
+
+
+async def run_load_test(users: int = 10, iterations: int = 3, db_path: str = None,
+                        throttled: bool = False, seed: int = 0) -> Dict[str, Any]:
+    api = FakeBotAPI()
+    await api.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite+aiosqlite:///{db_path or Path(tmp) / 'loadtest.sqlite3'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(setup_schema)
+        counter = QueryCounter()
+        counter.attach(engine)
+
+        session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        storage = SQLiteStorage(session_pool)
+        dp = build_dispatcher(storage, session_pool)
+
+        labels: Dict[int, str] = {}
+
+        async def label_update(handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                               update: Update, data: Dict[str, Any]) -> Any:
+            label = [labels.get(update.update_id)]
+            token = _current_handler.set(label)
+            try:
+                return await handler(update, data)
+            finally:
+                label[0] = None
+                _current_handler.reset(token)
+
+        dp.update.outer_middleware(label_update)
+
+        server = TelegramAPIServer.from_base(api.base_url)
+        if throttled:
+            session = ThrottledSession(OutboundScheduler(), api=server)
+        else:
+            session = AiohttpSession(api=server)
+        bot = Bot(token='42:LOADTEST', session=session)
+        polling = asyncio.create_task(dp.start_polling(bot, polling_timeout=1, handle_signals=False))
+
+        rng = random.Random(seed)
+        samples: Dict[str, List[float]] = defaultdict(list)
+        simulated = [SimulatedUser(api, FIRST_USER_ID + index, samples, labels, random.Random(rng.random()))
+                     for index in range(users)]
+
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(user.run(iterations) for user in simulated))
+            duration = time.perf_counter() - started
+        finally:
+            await dp.stop_polling()
+            await polling
+            release_routers(dp)
+            await storage.close()
+            await engine.dispose()
+            await api.stop()
+
+    updates = sum(len(values) for values in samples.values())
+    return {
+        'config': {'users': users, 'iterations': iterations, 'throttled': throttled, 'seed': seed},
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'duration': round(duration, 3),
+        'updates': updates,
+        'throughput': round(updates / duration, 2),
+        'queries': sum(counter.queries.values()),
+        'background_queries': counter.queries.get(BACKGROUND, 0),
+        'handlers': {
+            handler: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(max(values) * 1000, 2),
+                'queries': counter.queries.get(handler, 0),
+                'queries_per_update': round(counter.queries.get(handler, 0) / len(values), 2),
+                'query_time_ms': round(counter.seconds.get(handler, 0) * 1000, 2),
+            }
+            for handler, values in sorted(samples.items())
+        },
+        'api_calls': dict(api.calls),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"Апдейтов: {report['updates']} за {report['duration']} с "
+          f"({report['throughput']} в секунду), SQL-запросов: {report['queries']}")
+    print(f"{'обработчик':<20} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL/апдейт':>11}")
+    for handler, stats in report['handlers'].items():
+        print(f"{handler:<20} {stats['count']:>5} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+              f"{stats['p99_ms']:>8} {stats['queries_per_update']:>11}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.loadtest',
+                                     description='Нагрузочный прогон бота против локального Bot API')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--db', help='файл SQLite для прогона (по умолчанию временный)')
+    parser.add_argument('--throttled', action='store_true', help='отправлять через ThrottledSession')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='куда сохранить JSON (по умолчанию bench/results/)')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load_test(args.users, args.iterations, args.db, args.throttled, args.seed))
+    print_report(report)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f'Результаты сохранены в {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.types import Update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bench.fake_api import BOT_USER
+from bench.loadtest import RESULTS_DIR, percentile, print_report
+from bot.bot import build_dispatcher, release_routers
+from bot.config import BASE_DIR, RECORD_SALT
+from bot.metrics import MetricsMiddleware, MetricsRegistry, UpdateRecord
+from bot.recorder import IdAnonymizer, read_records
+from bot.storage import SQLiteStorage
+from database.models import build_engine, setup_schema
+
+REPLAY_BOT_ID = 42
+
+# колонки с id пользователей и чатов, которые в записи заменены псевдонимами
+ID_COLUMNS = (('users', 'tg_id'), ('tasks', 'user_id'), ('categories', 'tg_id'),
+              ('tasks_archive', 'user_id'), ('user_stats', 'tg_id'))
+
+
+# Bot без сети: на каждый вызов сразу отвечает правдоподобным результатом
+class StubSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.texts: List[str] = []
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[method.__api_method__] += 1
+        if getattr(method, 'text', None):
+            self.texts.append(method.text)
+        if isinstance(method, GetMe):
+            result = BOT_USER
+        elif getattr(method, 'chat_id', None) is not None and method.__returning__ is not bool:
+            self._message_id += 1
+            result = {
+                'message_id': getattr(method, 'message_id', None) or self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': method.chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': getattr(method, 'text', None) or '',
+            }
+        else:
+            result = True
+        response = self.check_response(bot, method, 200, json.dumps({'ok': True, 'result': result}))
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+class ReplayMetrics(MetricsMiddleware):
+    def __init__(self):
+        super().__init__(MetricsRegistry(), slow_threshold=float('inf'))
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.statements: Dict[str, int] = defaultdict(int)
+
+    def observe(self, update: Update, record: UpdateRecord, duration: float, queries):
+        super().observe(update, record, duration, queries)
+        self.samples[record.handler].append(duration)
+        self.statements[record.handler] += queries.statements
+
+
+def copy_database(source: Path, target: Path):
+    # через backup API, чтобы в копию попало и содержимое WAL работающего бота
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def anonymize_database(path: Path, anonymizer: IdAnonymizer, bot_id: int = REPLAY_BOT_ID):
+    # id в записи заменены теми же HMAC-псевдонимами, иначе ни один пользователь
+    # из записи не найдет в копии свои задачи и состояние FSM.
+    # Соединение открыто без PRAGMA foreign_keys, поэтому users и ссылающиеся на них tasks
+    # можно переписать по очереди
+    with sqlite3.connect(path) as conn:
+        conn.create_function('anonymize_id', 1, anonymizer.anonymize_id, deterministic=True)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table, column in ID_COLUMNS:
+            if table in tables:
+                conn.execute(f'UPDATE {table} SET {column} = anonymize_id({column}) WHERE {column} IS NOT NULL')
+
+        if 'fsm_states' in tables:
+            # ключ вида bot:chat:user:thread:destiny, см. SQLiteStorage._storage_key
+            keys = [row[0] for row in conn.execute('SELECT key FROM fsm_states')]
+            for key in keys:
+                _, chat_id, user_id, rest = key.split(':', 3)
+                conn.execute('UPDATE fsm_states SET key = ? WHERE key = ?', (
+                    f'{bot_id}:{anonymizer.anonymize_id(int(chat_id))}:'
+                    f'{anonymizer.anonymize_id(int(user_id))}:{rest}', key))
+
+        if 'tasks_fts' in tables:
+            # триггер поискового индекса не следит за user_id
+            conn.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def parse_speed(value: str) -> float:
+    # множитель скорости: 1 — как записано, 10 — в 10 раз быстрее, max — без пауз
+    if value == 'recorded':
+        return 1.0
+    if value == 'max':
+        return float('inf')
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError('скорость должна быть больше нуля')
+    return speed
+
+
+async def replay(paths: List[Union[str, Path]], db_path: Optional[Union[str, Path]] = None,
+                 speed: float = float('inf'), salt: Optional[str] = RECORD_SALT,
+                 session: Optional[StubSession] = None) -> Dict[str, Any]:
+    # копия базы имеет смысл только с той же солью, что была у UpdateRecorder
+    if db_path is not None and not salt:
+        raise ValueError('Для прогона на копии базы нужна соль записи (RECORD_SALT)')
+    records = list(read_records(paths))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = Path(tmp) / 'replay.sqlite3'
+        if db_path is not None:
+            copy_database(Path(db_path), scratch)
+            anonymize_database(scratch, IdAnonymizer(salt))
+        engine = build_engine(f'sqlite+aiosqlite:///{scratch}')
+        async with engine.begin() as conn:
+            await conn.run_sync(setup_schema)
+
+        session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        storage = SQLiteStorage(session_pool)
+        dp = build_dispatcher(storage, session_pool)
+        metrics = ReplayMetrics()
+        metrics.setup(dp)
+        session = session or StubSession()
+        bot = Bot(token=f'{REPLAY_BOT_ID}:REPLAY', session=session)
+
+        # апдейты одного пользователя обрабатываются строго по порядку записи,
+        # иначе состояния FSM разъедутся между прогонами; разные пользователи идут параллельно
+        locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+        async def feed(update: Update, user_id: int):
+            async with locks[user_id]:
+                await dp.feed_update(bot, update)
+
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            tasks = []
+            first = records[0]['t'] if records else 0
+            for record in records:
+                delay = (record['t'] - first) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                update = Update.model_validate(record['u'], context={'bot': bot})
+                user = getattr(update.event, 'from_user', None)
+                tasks.append(asyncio.create_task(feed(update, user.id if user else 0)))
+            await asyncio.gather(*tasks)
+            duration = time.perf_counter() - started
+        finally:
+            release_routers(dp)
+            await storage.close()
+            await engine.dispose()
+
+    updates = sum(len(values) for values in metrics.samples.values())
+    return {
+        'config': {'logs': [str(path) for path in paths], 'db': str(db_path) if db_path else None,
+                   'speed': 'max' if speed == float('inf') else speed},
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'duration': round(duration, 3),
+        'updates': updates,
+        'throughput': round(updates / duration, 2) if duration else 0,
+        'queries': sum(metrics.statements.values()),
+        'handlers': {
+            handler: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(max(values) * 1000, 2),
+                'queries_per_update': round(metrics.statements[handler] / len(values), 2),
+            }
+            for handler, values in sorted(metrics.samples.items())
+        },
+        'api_calls': dict(session.calls),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.replay',
+                                     description='Повтор записанных апдейтов на копии базы')
+    parser.add_argument('logs', nargs='+', help='файлы или каталоги с записью UpdateRecorder')
+    parser.add_argument('--db', default=str(BASE_DIR / 'db.sqlite3'),
+                        help='база, копия которой используется для прогона')
+    parser.add_argument('--empty-db', action='store_true', help='прогон на пустой базе')
+    parser.add_argument('--salt', default=RECORD_SALT,
+                        help='соль, с которой велась запись (по умолчанию RECORD_SALT)')
+    parser.add_argument('--speed', type=parse_speed, default=float('inf'),
+                        help='recorded, множитель (например 10) или max (по умолчанию)')
+    parser.add_argument('--out', help='куда сохранить JSON (по умолчанию bench/results/)')
+    args = parser.parse_args(argv)
+    if not args.empty_db and not args.salt:
+        parser.error('без соли записи id в копии базы не совпадут с записанными: '
+                     'укажите --salt (RECORD_SALT) или --empty-db')
+
+    report = asyncio.run(replay(args.logs, None if args.empty_db else args.db, args.speed, args.salt))
+    print_report(report)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"replay-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f'Результаты сохранены в {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import random
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import Category, Task, User
+
+# пользователь, от имени которого идут запросы в бенчмарках
+BENCH_USER = 1
+CATEGORY_NAMES = ('Работа', 'Дом', 'Учеба', 'Спорт', 'Покупки')
+TASK_WORDS = ('купить', 'позвонить', 'написать', 'сдать', 'проверить', 'отчет', 'курсовая',
+              'молоко', 'встреча', 'тренировка', 'врач', 'билеты', 'презентация', 'код', 'письмо')
+INSERT_CHUNK = 10_000
+
+
+class Scale(NamedTuple):
+    users: int
+    tasks_per_user: int
+
+
+SCALES = {
+    'tasks10': Scale(users=1, tasks_per_user=10),
+    'tasks1k': Scale(users=1, tasks_per_user=1_000),
+    'tasks100k': Scale(users=1, tasks_per_user=100_000),
+    'users10k': Scale(users=10_000, tasks_per_user=10),
+}
+
+
+async def seed_database(session_pool: async_sessionmaker, scale: Scale, seed: int = 0, now: datetime = None):
+    # данные одинаковые при одном seed, чтобы замеры разных прогонов были сравнимы;
+    # рассчитано на пустую базу: id категорий задаются явно
+    rng = random.Random(seed)
+    now = now or datetime.now()
+
+    async with session_pool() as session:
+        users = [{'tg_id': tg_id, 'username': f'user{tg_id}'} for tg_id in range(1, scale.users + 1)]
+        categories = [
+            {'id': (tg_id - 1) * len(CATEGORY_NAMES) + index + 1, 'tg_id': tg_id, 'name': name}
+            for tg_id in range(1, scale.users + 1) for index, name in enumerate(CATEGORY_NAMES)
+        ]
+        for table, rows in ((User, users), (Category, categories)):
+            for start in range(0, len(rows), INSERT_CHUNK):
+                await session.execute(insert(table), rows[start:start + INSERT_CHUNK])
+
+        chunk = []
+        for tg_id in range(1, scale.users + 1):
+            for index in range(scale.tasks_per_user):
+                chunk.append(_task_row(rng, tg_id, index, now))
+                if len(chunk) == INSERT_CHUNK:
+                    await session.execute(insert(Task), chunk)
+                    chunk = []
+        if chunk:
+            await session.execute(insert(Task), chunk)
+        await session.commit()
+
+
+def _task_row(rng: random.Random, tg_id: int, index: int, now: datetime) -> dict:
+    created_at = now - timedelta(days=rng.randrange(60), minutes=rng.randrange(24 * 60))
+    is_completed = rng.random() < 0.3
+    category = rng.randrange(len(CATEGORY_NAMES) + 1)
+    return {
+        'user_id': tg_id,
+        'name': f"{' '.join(rng.sample(TASK_WORDS, 2)).capitalize()} {index}",
+        'description': ' '.join(rng.sample(TASK_WORDS, 4)) if rng.random() < 0.5 else None,
+        'category_id': (tg_id - 1) * len(CATEGORY_NAMES) + category if category else None,
+        'priority': rng.choice((1, 2, 2, 3)),
+        'deadline': now + timedelta(hours=rng.randrange(-240, 240)) if rng.random() < 0.7 else None,
+        'created_at': created_at,
+        'is_completed': is_completed,
+        'completed_at': created_at + timedelta(days=rng.randrange(5)) if is_completed else None,
+    }
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.requests import ARCHIVE_CHUNK_SIZE, archive_completed_tasks
+
+logger = logging.getLogger(__name__)
+
+
+# периодически переносит давно выполненные задачи в tasks_archive небольшими порциями
+class TaskArchiver:
+    def __init__(self, session_pool: async_sessionmaker,
+                 older_than: timedelta = timedelta(days=30),
+                 interval: timedelta = timedelta(hours=1),
+                 chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                 pause: float = 0.05):
+        self.session_pool = session_pool
+        self.older_than = older_than
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> int:
+        moved = await archive_completed_tasks(self.older_than, chunk_size=self.chunk_size,
+                                              pause=self.pause, session_pool=self.session_pool)
+        if moved:
+            logger.info('В архив перенесено задач: %s', moved)
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Ошибка архивации задач')
+            await asyncio.sleep(self.interval.total_seconds())
@@ -1,20 +1,102 @@
 import asyncio
-from bot.config import TOKEN
+import logging
+from datetime import timedelta
+from bot.config import (TOKEN, FSM_STATE_TTL, FSM_FLUSH_INTERVAL, BOT_MODE,
+                        WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST,
+                        WEBHOOK_PORT, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE,
+                        OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+                        OUTBOUND_MAX_RETRIES, REMINDER_ADVANCE_MINUTES, REMINDER_WINDOW_HOURS,
+                        REMINDER_CATCH_UP_HOURS, WRITE_BATCHING, WRITE_BATCH_DELAY_MS,
+                        WRITE_BATCH_MAX_OPS, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_MINUTES,
+                        ARCHIVE_CHUNK_SIZE, METRICS_HOST, METRICS_PORT, SLOW_UPDATE_MS,
+                        RECORD_UPDATES_DIR, RECORD_MAX_BYTES, RECORD_BACKUP_COUNT, RECORD_SALT,
+                        FLOOD_RATE, FLOOD_BURST, FLOOD_DB_CONCURRENCY, FLOOD_MAX_USERS, FLOOD_IDLE_SECONDS)
 from aiogram import Bot, Dispatcher
+from bot.archiver import TaskArchiver
 from bot.handlers import router as handlers_router
+from bot.inline import router as inline_router
 from bot.keyboards import router as keyboards_router
-from database.models import create_tables
+from bot.metrics import MetricsMiddleware, MetricsRegistry, MetricsServer
+from bot.middlewares import DbSessionMiddleware
+from bot.outbound import OutboundScheduler, ThrottledSession
+from bot.recorder import UpdateRecorder
+from bot.reminders import ReminderScheduler
+from bot.storage import SQLiteStorage
+from bot.throttling import FloodControlMiddleware
+from bot.webhook import run_webhook
+from database.migrations import backfill_completed_at, backfill_task_categories
+from database.models import create_tables, async_session, engine, describe_engine
+from database.requests import enable_write_batching, disable_write_batching
+
+def build_dispatcher(storage, session_pool) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+    dp.update.middleware(DbSessionMiddleware(session_pool))
+    dp.include_routers(handlers_router, keyboards_router, inline_router)
+    return dp
+
+
+def release_routers(dp: Dispatcher):
+    # роутеры создаются один раз на процесс и цепляются только к одному Dispatcher;
+    # нагрузочному прогону и тестам нужно уметь собрать следующий
+    for router in list(dp.sub_routers):
+        router._parent_router = None
+        dp.sub_routers.remove(router)
+
 
 async def main():
     await create_tables()
-    bot = Bot(token=TOKEN)
-    dp = Dispatcher()
-    dp.include_router(handlers_router)
-    dp.include_router(keyboards_router)
-    await dp.start_polling(bot)
+    await backfill_task_categories()
+    await backfill_completed_at()
+    logging.info('Настройки базы данных: %s', await describe_engine(engine))
+    scheduler = OutboundScheduler(global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE,
+                                  chat_burst=OUTBOUND_CHAT_BURST)
+    bot = Bot(token=TOKEN, session=ThrottledSession(scheduler, max_retries=OUTBOUND_MAX_RETRIES))
+    storage = SQLiteStorage(async_session, ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL)
+    dp = build_dispatcher(storage, async_session)
+
+    if RECORD_UPDATES_DIR:
+        recorder = UpdateRecorder(RECORD_UPDATES_DIR, max_bytes=RECORD_MAX_BYTES,
+                                  backup_count=RECORD_BACKUP_COUNT, salt=RECORD_SALT)
+        dp.update.outer_middleware(recorder)
+        dp.shutdown.register(recorder.close)
+
+    metrics = MetricsRegistry()
+    MetricsMiddleware(metrics, slow_threshold=SLOW_UPDATE_MS / 1000).setup(dp)
+    if METRICS_PORT:
+        metrics_server = MetricsServer(metrics, host=METRICS_HOST, port=METRICS_PORT)
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
+
+    FloodControlMiddleware(rate=FLOOD_RATE, burst=FLOOD_BURST, db_concurrency=FLOOD_DB_CONCURRENCY,
+                           max_users=FLOOD_MAX_USERS, idle_ttl=FLOOD_IDLE_SECONDS).setup(dp)
+
+    if WRITE_BATCHING:
+        enable_write_batching(async_session, max_delay=WRITE_BATCH_DELAY_MS / 1000, max_batch=WRITE_BATCH_MAX_OPS)
+        dp.shutdown.register(disable_write_batching)
+
+    reminders = ReminderScheduler(bot, async_session,
+                                  advance=timedelta(minutes=REMINDER_ADVANCE_MINUTES),
+                                  window=timedelta(hours=REMINDER_WINDOW_HOURS),
+                                  catch_up=timedelta(hours=REMINDER_CATCH_UP_HOURS))
+    dp.startup.register(reminders.start)
+    dp.shutdown.register(reminders.stop)
+
+    archiver = TaskArchiver(async_session, older_than=timedelta(days=ARCHIVE_AFTER_DAYS),
+                            interval=timedelta(minutes=ARCHIVE_INTERVAL_MINUTES),
+                            chunk_size=ARCHIVE_CHUNK_SIZE)
+    dp.startup.register(archiver.start)
+    dp.shutdown.register(archiver.stop)
+
+    if BOT_MODE == 'webhook':
+        await run_webhook(dp, bot, url=WEBHOOK_URL, path=WEBHOOK_PATH, host=WEBHOOK_HOST,
+                          port=WEBHOOK_PORT, secret_token=WEBHOOK_SECRET,
+                          workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
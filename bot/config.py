@@ -1,6 +1,74 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 TOKEN = os.getenv("TOKEN")
+
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{BASE_DIR / 'db.sqlite3'}")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    # отрицательное значение — размер в КиБ, а не в страницах
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    # без него SQLite не выполняет ON DELETE CASCADE / SET NULL из моделей
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "ON"),
+}
+
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 24 * 60 * 60))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 1.0))
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 32))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", 3))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+
+REMINDER_ADVANCE_MINUTES = int(os.getenv("REMINDER_ADVANCE_MINUTES", 15))
+REMINDER_WINDOW_HOURS = int(os.getenv("REMINDER_WINDOW_HOURS", 24))
+REMINDER_CATCH_UP_HOURS = int(os.getenv("REMINDER_CATCH_UP_HOURS", 12))
+
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "0") == "1"
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", 5))
+WRITE_BATCH_MAX_OPS = int(os.getenv("WRITE_BATCH_MAX_OPS", 50))
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_INTERVAL_MINUTES = int(os.getenv("ARCHIVE_INTERVAL_MINUTES", 60))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 500))
+
+# пустой порт выключает эндпоинт /metrics
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", 500))
+
+# запись входящих апдейтов для bench.replay; пустой каталог выключает запись
+RECORD_UPDATES_DIR = os.getenv("RECORD_UPDATES_DIR")
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", 10 * 1024 * 1024))
+RECORD_BACKUP_COUNT = int(os.getenv("RECORD_BACKUP_COUNT", 5))
+RECORD_SALT = os.getenv("RECORD_SALT")
+
+# лимит апдейтов от одного пользователя и число одновременных тяжелых запросов к базе
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", 2))
+FLOOD_BURST = float(os.getenv("FLOOD_BURST", 5))
+FLOOD_DB_CONCURRENCY = int(os.getenv("FLOOD_DB_CONCURRENCY", 4))
+FLOOD_MAX_USERS = int(os.getenv("FLOOD_MAX_USERS", 10_000))
+FLOOD_IDLE_SECONDS = float(os.getenv("FLOOD_IDLE_SECONDS", 600))
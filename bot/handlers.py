@@ -3,13 +3,24 @@ from aiogram.filters import CommandStart, Command, StateFilter
 from aiogram import Router, F
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.ext.asyncio import AsyncSession
 from bot.keyboards import (all_info, back_to_menu_kb, back_in_task_kb,
                            confirm_kb, category_kb, deadline_kb,
-                           priority_kb, categories_kb)
+                           priority_kb, categories_kb, TasksPage, FindPage, tasks_page_kb)
 from database.requests import (get_or_create_user, create_task,
-                               get_user_tasks, get_tasks_for_today,
+                               get_tasks_page, get_tasks_for_today, get_tasks_for_week,
                                get_statistics, get_user_categories,
-                               create_category, complete_task, delete_task, get_tasks_by_category)
+                               create_category, complete_tasks, delete_tasks,
+                               get_category_task_counts, get_data_version, search_tasks,
+                               get_task_history)
+from database.models import TASK_NAME_LIMIT
+from bot.task_handles import (StaleSnapshot, remember_task_list,
+                              resolve_task_handles, rebase_snapshot)
+from bot.render_cache import render_cache, LIST_SCREEN, TODAY_SCREEN, STATS_SCREEN
+from bot.throttling import DB_HEAVY, db_slot
+
+from database.cache import LRUCache
 
 from datetime import datetime
 
@@ -43,6 +54,8 @@ async def cmd_help(message: Message):
 ⭐ Основные команды:
 
 ◎ /next - Быстрое начало работы
+◎ /find <текст> - Поиск по задачам
+◎ /history - Выполненные задачи
 ◎ /help - Справка""", reply_markup=all_info)
 
     global help_message_id
@@ -81,78 +94,204 @@ async def add_tasks_button(message: Message, state: FSMContext):
     await state.set_state(CreateTask.name)
     await message.answer('Введите название задачи: ', reply_markup=back_in_task_kb)
 
-@router.message(F.text == 'Список задач')
-async def list_tasks(message: Message):
-    tasks = await get_user_tasks(message.from_user.id, completed=False)
+@router.message(F.text == 'Список задач', flags=DB_HEAVY)
+async def list_tasks(message: Message, session: AsyncSession = None):
+    message_text, keyboard = await render_tasks_page(message.from_user.id, session=session)
 
-    if not tasks:
+    if message_text is None:
         await message.answer('📭 Нет активных задач!')
         return
 
-    message_text = format_tasks_list(tasks)
-    await message.answer(message_text)
+    await message.answer(message_text, reply_markup=keyboard)
+
+TASKS_PAGE_SIZE = 10
+MESSAGE_LIMIT = 4096
+DESCRIPTION_LIMIT = 1000
 
-def format_tasks_list(tasks):
+TASKS_HEADER = "📋 Ваши задачи:\n\n"
+TASKS_FOOTER = (
+    "\n📝 Команды:\n"
+    "/done <ID> — отметить как выполненную\n"
+    "/delete <ID> — удалить задачу\n"
+    "Можно сразу несколько: /done 1 3 5-9"
+)
+
+def format_task(index, task):
     priority_emojis = {
         1: '⚪ Низкий',
         2: '🟡 Средний',
         3: '🔴 Высокий'
     }
 
-    text = "📋 Ваши задачи:\n\n"
-
-    for index, task in enumerate(tasks, start=1):
-        deadline = task.deadline.strftime('%d.%m.%Y %H:%M') if task.deadline else 'без срока'
-        category = f"🏷️ {task.category}\n" if task.category else ""
-        priority = priority_emojis.get(task.priority, '⚪ Низкий')
-
-        text += (
-            f"ID: {index}\n"
-            f"📝 {task.name}\n"
-            f"📄 {task.description or 'Без описания'}\n"
-            f"{category}"
-            f"📊 {priority}\n"
-            f"⏰ Дедлайн: {deadline}\n"
-            f"────────────────────\n"
-        )
+    deadline = task.deadline.strftime('%d.%m.%Y %H:%M') if task.deadline else 'без срока'
+    category = f"🏷️ {task.category}\n" if task.category else ""
+    priority = priority_emojis.get(task.priority, '⚪ Низкий')
+    description = task.description or 'Без описания'
+    if len(description) > DESCRIPTION_LIMIT:
+        description = description[:DESCRIPTION_LIMIT] + '…'
+    # SQLite не проверяет длину колонки, старые задачи могли сохраниться с длинным названием
+    name = task.name
+    if len(name) > TASK_NAME_LIMIT:
+        name = name[:TASK_NAME_LIMIT] + '…'
+
+    return (
+        f"ID: {index}\n"
+        f"📝 {name}\n"
+        f"📄 {description}\n"
+        f"{category}"
+        f"📊 {priority}\n"
+        f"⏰ Дедлайн: {deadline}\n"
+        f"────────────────────\n"
+    )
 
-    text += (
-        "\n📝 Команды:\n"
-        "/done <ID> — отметить как выполненную\n"
-        "/delete <ID> — удалить задачу\n"
-        "Пример: /done 1"
+def format_tasks_list(tasks, start=1):
+    blocks = [format_task(index, task) for index, task in enumerate(tasks, start=start)]
+    return "".join([TASKS_HEADER, *blocks, TASKS_FOOTER])
+
+def text_length(text):
+    # Telegram считает длину сообщения в UTF-16
+    return len(text.encode('utf-16-le')) // 2
+
+def fit_tasks_page(tasks, start, backward=False, limit=MESSAGE_LIMIT):
+    budget = limit - text_length(TASKS_HEADER) - text_length(TASKS_FOOTER)
+    ordered = reversed(tasks) if backward else tasks
+
+    shown = []
+    used = 0
+    for offset, task in enumerate(ordered):
+        position = start - 1 - offset if backward else start + offset
+        block = format_task(position, task)
+        size = text_length(block)
+        if shown and used + size > budget:
+            break
+        shown.append((position, task, block))
+        used += size
+
+    if backward:
+        shown.reverse()
+    return shown
+
+def format_cursor_deadline(deadline):
+    return deadline.strftime('%Y%m%d%H%M%S%f') if deadline else None
+
+def parse_cursor_deadline(value):
+    return datetime.strptime(value, '%Y%m%d%H%M%S%f') if value else None
+
+def page_cursor(direction, position, task):
+    return TasksPage(direction=direction, position=position, priority=task.priority,
+                     id=task.id, deadline=format_cursor_deadline(task.deadline))
+
+async def render_tasks_page(tg_id, page: TasksPage = None, session: AsyncSession = None):
+    version = get_data_version(tg_id)
+    backward = page is not None and page.direction == 'p'
+
+    # первую страницу открывают чаще всего, ее держим в кэше до следующего изменения задач
+    if page is None:
+        cached = render_cache.get(tg_id, LIST_SCREEN, version)
+        if cached is not None:
+            message_text, keyboard, positions = cached.value
+            remember_task_list(tg_id, positions, version)
+            return message_text, keyboard
+
+    if page is None:
+        start, bounds = 1, {}
+    else:
+        start = page.position
+        key = (page.priority, parse_cursor_deadline(page.deadline), page.id)
+        bounds = {'before': key} if backward else {'after': key}
+    async with db_slot():
+        result = await get_tasks_page(tg_id, page_size=TASKS_PAGE_SIZE, session=session, **bounds)
+
+    if not result.tasks:
+        if page is None:
+            render_cache.set(tg_id, LIST_SCREEN, version, (None, None, ()))
+        return None, None
+
+    shown = fit_tasks_page(result.tasks, start, backward=backward)
+    truncated = result.has_more or len(shown) < len(result.tasks)
+
+    if backward:
+        has_prev, has_next = truncated, True
+        if not has_prev and shown[0][0] != 1:
+            # после выполнения задач через /done нумерация могла сдвинуться
+            shown = fit_tasks_page([task for _, task, _ in shown], 1)
+    else:
+        has_prev, has_next = start > 1, truncated
+
+    positions = [(position, task.id) for position, task, _ in shown]
+    remember_task_list(tg_id, positions, version)
+
+    first_position, first_task, _ = shown[0]
+    last_position, last_task, _ = shown[-1]
+    keyboard = tasks_page_kb(
+        page_cursor('p', first_position, first_task) if has_prev else None,
+        page_cursor('n', last_position + 1, last_task) if has_next else None
     )
 
-    return text
+    message_text = "".join([TASKS_HEADER, *(block for _, _, block in shown), TASKS_FOOTER])
+    if page is None:
+        render_cache.set(tg_id, LIST_SCREEN, version, (message_text, keyboard, positions))
+    return message_text, keyboard
 
-@router.message(F.text == 'Задачи на сегодня')
-async def tasks_on_today(message: Message):
-    tasks = await get_tasks_for_today(message.from_user.id)
+@router.message(F.text == 'Задачи на сегодня', flags=DB_HEAVY)
+async def tasks_on_today(message: Message, session: AsyncSession = None):
+    message_text = await render_today(message.from_user.id, session=session)
 
-    if not tasks:
+    if message_text is None:
         await message.answer('🎉 На сегодня задач нет!')
         return
 
-    message_text = "📅 Задачи на сегодня:\n\n"
-    priority_emojis = {1: '⚪', 2: '🟡', 3: '🔴'}
+    await message.answer(message_text)
 
-    for task in tasks:
-        if task.deadline:
-            time_str = task.deadline.strftime('%H:%M')
-            deadline_info = f"⏰ {time_str}"
-        else:
-            deadline_info = ""
+async def render_today(tg_id, session: AsyncSession = None):
+    version = get_data_version(tg_id)
+    today = datetime.now().date()
 
-        priority_emoji = priority_emojis.get(task.priority, '⚪')
-        category_text = f"🏷️ {task.category}" if task.category else ""
+    cached = render_cache.get(tg_id, TODAY_SCREEN, version, day=today)
+    if cached is not None:
+        return cached.value
 
-        message_text += (
-            f"{priority_emoji} {task.name}\n"
-            f"{deadline_info} {category_text}\n"
-            f"{task.description}\n"
-            f"────────────────────\n")
+    async with db_slot():
+        tasks = await get_tasks_for_today(tg_id, session=session)
+    message_text = format_deadline_tasks(tasks, "📅 Задачи на сегодня:") if tasks else None
+    render_cache.set(tg_id, TODAY_SCREEN, version, message_text, day=today)
+    return message_text
 
-    await message.answer(message_text)
+def format_deadline_task(task, time_format='%H:%M'):
+    priority_emojis = {1: '⚪', 2: '🟡', 3: '🔴'}
+    deadline_info = f"⏰ {task.deadline.strftime(time_format)}" if task.deadline else ""
+    priority_emoji = priority_emojis.get(task.priority, '⚪')
+    category_text = f"🏷️ {task.category}" if task.category else ""
+    name = task.name
+    if len(name) > TASK_NAME_LIMIT:
+        name = name[:TASK_NAME_LIMIT] + '…'
+    description = task.description or 'Без описания'
+    if len(description) > DESCRIPTION_LIMIT:
+        description = description[:DESCRIPTION_LIMIT] + '…'
+    return (
+        f"{priority_emoji} {name}\n"
+        f"{deadline_info} {category_text}\n"
+        f"{description}\n"
+        f"────────────────────\n")
+
+def format_deadline_tasks(tasks, title, time_format='%H:%M', limit=MESSAGE_LIMIT):
+    header = f"{title}\n\n"
+    # место под строку о пропущенных задачах оставляем заранее, число в ней не длиннее общего
+    budget = limit - text_length(header) - text_length(format_skipped_tasks(len(tasks)))
+    lines = [header]
+    used = 0
+    for shown, task in enumerate(tasks):
+        block = format_deadline_task(task, time_format)
+        size = text_length(block)
+        if used + size > budget:
+            lines.append(format_skipped_tasks(len(tasks) - shown))
+            break
+        lines.append(block)
+        used += size
+    return "".join(lines)
+
+def format_skipped_tasks(count):
+    return f"…и еще задач: {count}, не поместились в сообщение"
 
 ##################################################################################################
 
@@ -212,7 +351,7 @@ async def back_in_task_handler(callback: CallbackQuery, state: FSMContext):
 #ЭТОТ ОБРАБОТЧИК ВЫВОДИТ СООБЩЕНИЕ ПОСЛЕ СОХРАНЕНИЕ ЗАДАЧИ С УКАЗАНИЕМ ЕЕ ID
 ##################################################################################################
 @router.callback_query(F.data == 'save_task')
-async def save_task_handler(callback: CallbackQuery, state: FSMContext):
+async def save_task_handler(callback: CallbackQuery, state: FSMContext, session: AsyncSession = None):
     data = await state.get_data()
     deadline_str = data.get('deadline')
     deadline = None
@@ -228,7 +367,8 @@ async def save_task_handler(callback: CallbackQuery, state: FSMContext):
         description=data.get('description'),
         category=data.get('category'),
         priority=data.get('priority', 2),
-        deadline=deadline
+        deadline=deadline,
+        session=session
     )
 
     await state.clear()
@@ -252,15 +392,20 @@ async def add_tasks_inline(callback: CallbackQuery, state: FSMContext):
 
 @router.message(CreateTask.name)
 async def add_name(message: Message, state: FSMContext):
+    if len(message.text) > TASK_NAME_LIMIT:
+        await message.answer(f'❌ Название задачи слишком длинное (макс. {TASK_NAME_LIMIT} символов)',
+                             reply_markup=back_in_task_kb)
+        return
+
     await state.update_data(name=message.text)
     await state.set_state(CreateTask.description)
     await message.answer('Введите описание задачи: ', reply_markup=back_in_task_kb)
 
 
 @router.message(CreateTask.description)
-async def add_description(message: Message, state: FSMContext):
+async def add_description(message: Message, state: FSMContext, session: AsyncSession = None):
     await state.update_data(description=message.text)
-    categories = await get_user_categories(message.from_user.id)
+    categories = await get_user_categories(message.from_user.id, session=session)
 
     categories_text = ""
     if categories:
@@ -400,17 +545,30 @@ async def show_confirmation(message: Message, state: FSMContext):
 #ОБРАБОТЧИК ДЛЯ ВЫВОДА ВСЕХ ЗАДАЧ
 ##################################################################################################
 
-@router.callback_query(F.data == 'list task')
-async def lists_tasks_inline(callback: CallbackQuery):
-    tasks = await get_user_tasks(callback.from_user.id, completed=False)
+@router.callback_query(F.data == 'list task', flags=DB_HEAVY)
+async def lists_tasks_inline(callback: CallbackQuery, session: AsyncSession = None):
+    message_text, keyboard = await render_tasks_page(callback.from_user.id, session=session)
 
-    if not tasks:
+    if message_text is None:
         await callback.message.answer('📭 Нет активных задач!')
         await callback.answer()
         return
 
-    message_text = format_tasks_list(tasks)
-    await callback.message.answer(message_text)
+    await callback.message.answer(message_text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(TasksPage.filter(), flags=DB_HEAVY)
+async def tasks_page_inline(callback: CallbackQuery, callback_data: TasksPage, session: AsyncSession = None):
+    message_text, keyboard = await render_tasks_page(callback.from_user.id, callback_data, session=session)
+
+    if message_text is None:
+        await callback.answer('📭 Больше задач нет')
+        return
+
+    try:
+        await callback.message.edit_text(message_text, reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass
     await callback.answer()
 
 ##################################################################################################
@@ -418,36 +576,36 @@ async def lists_tasks_inline(callback: CallbackQuery):
 #ОБРАБОТЧИК ДЛЯ ВЫВОДА ЗАДАЧ НА СЕГОДНЯ
 ##################################################################################################
 
-@router.callback_query(F.data == 'task on today')
-async def task_on_today_inline(callback: CallbackQuery):
-    tasks = await get_tasks_for_today(callback.from_user.id)
+@router.callback_query(F.data == 'task on today', flags=DB_HEAVY)
+async def task_on_today_inline(callback: CallbackQuery, session: AsyncSession = None):
+    message_text = await render_today(callback.from_user.id, session=session)
 
-    if not tasks:
+    if message_text is None:
         await callback.message.answer('🎉 На сегодня задач нет!')
         await callback.answer()
         return
 
-    message_text = "📅 Задачи на сегодня:\n\n"
-    priority_emojis = {1: '⚪', 2: '🟡', 3: '🔴'}
+    await callback.message.answer(message_text)
+    await callback.answer('📅 Задачи на сегодня')
 
-    for task in tasks:
-        if task.deadline:
-            time_str = task.deadline.strftime('%H:%M')
-            deadline_info = f"⏰ {time_str}"
-        else:
-            deadline_info = ""
+##################################################################################################
 
-        priority_emoji = priority_emojis.get(task.priority, '⚪')
-        category_text = f"🏷️ {task.category}" if task.category else ""
+#ОБРАБОТЧИК ДЛЯ ВЫВОДА ЗАДАЧ НА НЕДЕЛЮ
+##################################################################################################
 
-        message_text += (
-            f"{priority_emoji} {task.name}\n"
-            f"{deadline_info} {category_text}\n"
-            f"{task.description}\n"
-            f"────────────────────\n")
+@router.callback_query(F.data == 'task on week', flags=DB_HEAVY)
+async def task_on_week_inline(callback: CallbackQuery, session: AsyncSession = None):
+    async with db_slot():
+        tasks = await get_tasks_for_week(callback.from_user.id, session=session)
 
+    if not tasks:
+        await callback.message.answer('🎉 На ближайшую неделю задач нет!')
+        await callback.answer()
+        return
+
+    message_text = format_deadline_tasks(tasks, "🗓 Задачи на неделю:", time_format='%d.%m %H:%M')
     await callback.message.answer(message_text)
-    await callback.answer('📅 Задачи на сегодня')
+    await callback.answer('🗓 Задачи на неделю')
 
 ##################################################################################################
 
@@ -466,22 +624,19 @@ async def category_inline(callback: CallbackQuery, state: FSMContext):
 #ОБРАБОТЧИК ДЛЯ ПРОСМОТРА СОХРАНЕННЫХ КАТЕГОРИЙ
 ##################################################################################################
 
-@router.callback_query(F.data == 'show_categories')
-async def show_categories_handler(callback: CallbackQuery):
-    categories = await get_user_categories(callback.from_user.id)
+@router.callback_query(F.data == 'show_categories', flags=DB_HEAVY)
+async def show_categories_handler(callback: CallbackQuery, session: AsyncSession = None):
+    async with db_slot():
+        counts = await get_category_task_counts(callback.from_user.id, session=session)
 
-    if not categories:
+    if not counts:
         await callback.message.answer('📭 У вас пока нет категорий!')
         await callback.answer()
         return
 
-    message_text = "📁 Ваши категории:\n\n"
-
-    for category_name in categories:
-        tasks = await get_tasks_by_category(callback.from_user.id, category_name)
-        count = len(tasks)
-
-        message_text += f"• {category_name} ({count} задач)\n"
+    message_text = "📁 Ваши категории:\n\n" + "".join(
+        f"• {category_name} ({count} задач)\n" for category_name, count in counts.items()
+    )
 
     await callback.message.answer(message_text)
     await callback.answer()
@@ -501,14 +656,14 @@ async def create_category_handler(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(CategoryActions.waiting_for_category_name)
-async def process_category_name(message: Message, state: FSMContext):
+async def process_category_name(message: Message, state: FSMContext, session: AsyncSession = None):
     category_name = message.text.strip()
 
     if len(category_name) > 50:
         await message.answer('❌ Название категории слишком длинное (макс. 50 символов)')
         return
 
-    category = await create_category(message.from_user.id, category_name)
+    category = await create_category(message.from_user.id, category_name, session=session)
 
     if category is None:
         await message.answer(f'❌ Категория "{category_name}" уже существует!')
@@ -524,43 +679,206 @@ async def process_category_name(message: Message, state: FSMContext):
 ##################################################################################################
 
 @router.message(F.text.startswith('/done'))
-async def mark_task_done(message: Message):
+async def mark_task_done(message: Message, session: AsyncSession = None):
+    await apply_to_tasks(
+        message, complete_tasks, session=session,
+        usage="❌ Использование: /done <ID> [<ID> ...]\nПример: /done 1 или /done 1 3 5-9",
+        done_single="✅ Задача «{name}» отмечена как выполненная!",
+        done_title="✅ Отмечено выполненными: {done} из {total}",
+    )
+
+##################################################################################################
+
+#ОБРАБОТЧИК ДЛЯ УДАЛЕНИЯ ЗАДАЧИ
+##################################################################################################
+
+@router.message(F.text.startswith('/delete'))
+async def delete_task_handler(message: Message, session: AsyncSession = None):
+    await apply_to_tasks(
+        message, delete_tasks, session=session,
+        usage="❌ Использование: /delete <ID> [<ID> ...]\nПример: /delete 1 или /delete 2-4",
+        done_single="🗑️ Задача «{name}» удалена!",
+        done_title="🗑️ Удалено: {done} из {total}",
+    )
+
+##################################################################################################
+
+#ОБЩАЯ ЛОГИКА /done И /delete ДЛЯ ОДНОГО ИЛИ НЕСКОЛЬКИХ ID
+##################################################################################################
+
+MAX_BULK_TASKS = 50
+
+
+def parse_task_positions(args):
+    # "1 3 5-9" или "1,3,5-9" -> [1, 3, 5, 6, 7, 8, 9] без повторов, в порядке ввода
+    positions = []
+    for arg in args:
+        for part in arg.split(','):
+            if not part:
+                continue
+            if '-' in part:
+                first, last = (int(bound) for bound in part.split('-', 1))
+                if first > last or last - first >= MAX_BULK_TASKS:
+                    raise ValueError(part)
+                positions.extend(range(first, last + 1))
+            else:
+                positions.append(int(part))
+            if len(positions) > MAX_BULK_TASKS:
+                raise ValueError(part)
+
+    if not positions:
+        raise ValueError('no positions')
+    return list(dict.fromkeys(positions))
+
+
+async def apply_to_tasks(message: Message, apply, usage: str, done_single: str, done_title: str,
+                         session: AsyncSession = None):
     try:
-        local_id = int(message.text.split()[1])
-        tasks = await get_user_tasks(message.from_user.id, completed=False)
+        positions = parse_task_positions(message.text.split()[1:])
+    except ValueError:
+        await message.answer(usage)
+        return
 
-        if local_id < 1 or local_id > len(tasks):
+    tg_id = message.from_user.id
+    task_ids = await resolve_task_ids(message, positions)
+    if task_ids is None:
+        return
+
+    known_ids = [task_id for task_id in task_ids.values() if task_id is not None]
+    names = await apply(tg_id, known_ids, session=session) if known_ids else {}
+    if names:
+        rebase_snapshot(tg_id, get_data_version(tg_id))
+
+    if len(positions) == 1:
+        task_id = task_ids[positions[0]]
+        if task_id is None:
             await message.answer("❌ Неверный ID задачи")
-            return
+        elif task_id not in names:
+            await message.answer("❌ Задача уже выполнена или удалена")
+        else:
+            await message.answer(done_single.format(name=names[task_id]))
+        return
 
-        task = tasks[local_id - 1]
-        await complete_task(message.from_user.id, task.id)
+    lines = [done_title.format(done=len(names), total=len(positions)), '']
+    for position in positions:
+        task_id = task_ids[position]
+        if task_id is None:
+            lines.append(f"{position}. ❌ неверный ID")
+        elif task_id not in names:
+            lines.append(f"{position}. ❌ уже выполнена или удалена")
+        else:
+            lines.append(f"{position}. ✅ {names[task_id]}")
+    await message.answer('\n'.join(lines))
 
-        await message.answer(f"✅ Задача «{task.name}» отмечена как выполненная!")
-    except (IndexError, ValueError):
-        await message.answer("❌ Использование: /done <ID>\nПример: /done 1")
+##################################################################################################
 
+#ПЕРЕВОД ID ИЗ ПОКАЗАННОГО СПИСКА В НАСТОЯЩИЕ ID ЗАДАЧ
 ##################################################################################################
 
-#ОБРАБОТЧИК ДЛЯ УДАЛЕНИЯ ЗАДАЧИ
+async def resolve_task_ids(message: Message, positions):
+    tg_id = message.from_user.id
+    try:
+        return resolve_task_handles(tg_id, positions, get_data_version(tg_id))
+    except StaleSnapshot:
+        await message.answer("⚠️ Список задач изменился или еще не открыт.\n"
+                             "Откройте «Список задач» заново и повторите команду.")
+        return None
+
 ##################################################################################################
 
-@router.message(F.text.startswith('/delete'))
-async def delete_task_handler(message: Message):
+#ПОИСК ПО ЗАДАЧАМ
+##################################################################################################
+
+SEARCH_PAGE_SIZE = 10
+SEARCH_CACHE_SIZE = 10_000
+
+# последний запрос /find каждого пользователя, чтобы кнопки страниц не таскали текст в callback_data
+_last_searches = LRUCache(maxsize=SEARCH_CACHE_SIZE)
+
+@router.message(Command('find'), flags=DB_HEAVY)
+async def find_tasks_handler(message: Message, session: AsyncSession = None):
+    query = message.text.partition(' ')[2].strip()
+    if not query:
+        await message.answer("❌ Использование: /find <текст>\nПример: /find курсовая")
+        return
+
+    _last_searches.set(message.from_user.id, query)
+    message_text, keyboard = await render_search_page(message.from_user.id, query, session=session)
+    await message.answer(message_text, reply_markup=keyboard)
+
+@router.callback_query(FindPage.filter(), flags=DB_HEAVY)
+async def find_page_inline(callback: CallbackQuery, callback_data: FindPage, session: AsyncSession = None):
+    query = _last_searches.get(callback.from_user.id)
+    if query is None:
+        await callback.answer('🔎 Поиск устарел, повторите /find')
+        return
+
+    message_text, keyboard = await render_search_page(callback.from_user.id, query,
+                                                      callback_data.offset, session=session)
     try:
-        local_id = int(message.text.split()[1])
-        tasks = await get_user_tasks(message.from_user.id, completed=False)
+        await callback.message.edit_text(message_text, reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
 
-        if local_id < 1 or local_id > len(tasks):
-            await message.answer("❌ Неверный ID задачи")
-            return
+async def render_search_page(tg_id, query, offset=0, session: AsyncSession = None):
+    async with db_slot():
+        result = await search_tasks(tg_id, query, offset=offset, page_size=SEARCH_PAGE_SIZE, session=session)
+    if not result.tasks:
+        return f'🔎 По запросу «{query}» ничего не найдено', None
+
+    keyboard = tasks_page_kb(
+        FindPage(offset=max(offset - SEARCH_PAGE_SIZE, 0)) if offset > 0 else None,
+        FindPage(offset=offset + SEARCH_PAGE_SIZE) if result.has_more else None
+    )
+    return format_search_results(result.tasks, query, start=offset + 1), keyboard
 
-        task = tasks[local_id - 1]
-        await delete_task(message.from_user.id, task.id)
+def format_search_results(tasks, query, start=1):
+    priority_emojis = {1: '⚪', 2: '🟡', 3: '🔴'}
+    lines = [f"🔎 Найдено по запросу «{query}»:\n\n"]
+
+    for index, task in enumerate(tasks, start):
+        status = " ✅" if task.is_completed else ""
+        details = []
+        if task.deadline:
+            details.append(f"⏰ {task.deadline.strftime('%d.%m.%Y %H:%M')}")
+        if task.category:
+            details.append(f"🏷️ {task.category}")
+
+        lines.append(f"{index}. {priority_emojis.get(task.priority, '⚪')} {task.name}{status}\n")
+        if details:
+            lines.append(f"   {' '.join(details)}\n")
 
-        await message.answer(f"🗑️ Задача «{task.name}» удалена!")
-    except (IndexError, ValueError):
-        await message.answer("❌ Использование: /delete <ID>\nПример: /delete 1")
+    return "".join(lines)
+
+##################################################################################################
+
+#ИСТОРИЯ ВЫПОЛНЕННЫХ ЗАДАЧ
+##################################################################################################
+
+HISTORY_LIMIT = 20
+
+@router.message(Command('history'), flags=DB_HEAVY)
+async def task_history_handler(message: Message, session: AsyncSession = None):
+    async with db_slot():
+        history = await get_task_history(message.from_user.id, limit=HISTORY_LIMIT, session=session)
+
+    if not history:
+        await message.answer('📭 Выполненных задач пока нет')
+        return
+
+    priority_emojis = {1: '⚪', 2: '🟡', 3: '🔴'}
+    lines = [f"✅ Последние выполненные задачи:\n\n"]
+    for entry in history:
+        details = []
+        if entry.completed_at:
+            details.append(entry.completed_at.strftime('%d.%m.%Y'))
+        if entry.category:
+            details.append(f"🏷️ {entry.category}")
+        suffix = f" — {' '.join(details)}" if details else ""
+        lines.append(f"{priority_emojis.get(entry.priority, '⚪')} {entry.name}{suffix}\n")
+
+    await message.answer("".join(lines))
 
 ##################################################################################################
 
@@ -581,10 +899,20 @@ async def delete_category_handler(callback: CallbackQuery):
 #ОБРАБОТЧИК ДЛЯ ПРОСМОТРА СТАТИСТИКИ
 ##################################################################################################
 
-@router.callback_query(F.data == 'stats')
-async def stats_inline(callback: CallbackQuery):
-    stats = await get_statistics(callback.from_user.id)
+@router.callback_query(F.data == 'stats', flags=DB_HEAVY)
+async def stats_inline(callback: CallbackQuery, session: AsyncSession = None):
+    message_text = await render_stats(callback.from_user.id, session=session)
+    await callback.message.answer(message_text)
+    await callback.answer()
+
+async def render_stats(tg_id, session: AsyncSession = None):
+    version = get_data_version(tg_id)
+    cached = render_cache.get(tg_id, STATS_SCREEN, version)
+    if cached is not None:
+        return cached.value
 
+    async with db_slot():
+        stats = await get_statistics(tg_id, with_categories=False, session=session)
     message_text = (
         f"📊 Статистика:\n\n"
         f"📈 Всего задач: {stats['total']}\n"
@@ -594,7 +922,7 @@ async def stats_inline(callback: CallbackQuery):
         f"🟡 Средний: {stats['priorities'].get(2, 0)}\n"
         f"⚪ Низкий: {stats['priorities'].get(1, 0)}"
     )
-    await callback.message.answer(message_text)
-    await callback.answer()
+    render_cache.set(tg_id, STATS_SCREEN, version, message_text)
+    return message_text
 
 ##################################################################################################
\ No newline at end of file
@@ -0,0 +1,147 @@
+import asyncio
+import re
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram import Router
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.throttling import DB_HEAVY, db_slot
+from database.cache import LRUCache
+from database.requests import get_data_version, get_user_tasks
+
+INLINE_INDEX_CACHE_SIZE = 1_000
+INLINE_RESULTS_LIMIT = 50
+# ответы персональные и зависят от задач, поэтому Telegram держит их недолго
+INLINE_CACHE_TIME = 10
+
+PRIORITY_EMOJIS = {1: '⚪', 2: '🟡', 3: '🔴'}
+
+router = Router()
+
+
+class InlineTask(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    category: Optional[str]
+    priority: int
+    deadline: object
+
+
+def split_words(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+
+# отсортированные слова из названий активных задач пользователя;
+# запрос «кур» - это бинарный поиск диапазона слов, начинающихся с «кур»
+class TaskPrefixIndex:
+    def __init__(self, version: int, tasks: List[InlineTask]):
+        self.version = version
+        self.tasks = tasks
+        self._words: List[Tuple[str, int]] = sorted(
+            (word, position) for position, task in enumerate(tasks) for word in set(split_words(task.name))
+        )
+        self._keys = [word for word, _ in self._words]
+
+    def search(self, query: str, limit: int = INLINE_RESULTS_LIMIT) -> List[InlineTask]:
+        terms = split_words(query)
+        if not terms:
+            return self.tasks[:limit]
+
+        # самое длинное слово запроса дает самый узкий диапазон
+        longest = max(terms, key=len)
+        start = bisect_left(self._keys, longest)
+        end = bisect_left(self._keys, longest + '\U0010ffff', lo=start)
+        positions = sorted({position for _, position in self._words[start:end]})
+
+        found = []
+        for position in positions:
+            task = self.tasks[position]
+            if len(terms) > 1:
+                words = split_words(task.name)
+                if not all(any(word.startswith(term) for word in words) for term in terms):
+                    continue
+            found.append(task)
+            if len(found) == limit:
+                break
+        return found
+
+
+class InlineTaskLookup:
+    def __init__(self, maxsize: int = INLINE_INDEX_CACHE_SIZE):
+        self._indexes = LRUCache(maxsize=maxsize)
+        self._building: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._latest_queries = LRUCache(maxsize=maxsize)
+
+    async def get_index(self, tg_id: int, session: AsyncSession = None) -> TaskPrefixIndex:
+        version = get_data_version(tg_id)
+        index = self._indexes.get(tg_id)
+        if index is not None and index.version == version:
+            return index
+
+        # пока индекс строится, следующие нажатия клавиш ждут тот же запрос к базе
+        key = (tg_id, version)
+        building = self._building.get(key)
+        if building is None:
+            building = asyncio.ensure_future(self._build(tg_id, version, session))
+            self._building[key] = building
+            building.add_done_callback(lambda _: self._building.pop(key, None))
+        return await asyncio.shield(building)
+
+    async def _build(self, tg_id: int, version: int, session: AsyncSession = None) -> TaskPrefixIndex:
+        # задача сборки наследует контекст обработчика, а с ним и его лимит на базу
+        async with db_slot():
+            tasks = await get_user_tasks(tg_id, session=session)
+        index = TaskPrefixIndex(version, [
+            InlineTask(task.id, task.name, task.description, task.category, task.priority, task.deadline)
+            for task in tasks
+        ])
+        self._indexes.set(tg_id, index)
+        return index
+
+    def mark_latest(self, tg_id: int, query_id: str):
+        self._latest_queries.set(tg_id, query_id)
+
+    def is_latest(self, tg_id: int, query_id: str) -> bool:
+        return self._latest_queries.get(tg_id) == query_id
+
+
+lookup = InlineTaskLookup()
+
+
+def format_inline_task(task: InlineTask) -> str:
+    lines = [f"{PRIORITY_EMOJIS.get(task.priority, '⚪')} {task.name}"]
+    if task.description:
+        lines.append(task.description)
+    details = []
+    if task.deadline:
+        details.append(f"⏰ {task.deadline.strftime('%d.%m.%Y %H:%M')}")
+    if task.category:
+        details.append(f"🏷️ {task.category}")
+    if details:
+        lines.append(' '.join(details))
+    return '\n'.join(lines)
+
+
+@router.inline_query(flags=DB_HEAVY)
+async def inline_tasks_handler(inline_query: InlineQuery, session: AsyncSession = None):
+    tg_id = inline_query.from_user.id
+    lookup.mark_latest(tg_id, inline_query.id)
+    index = await lookup.get_index(tg_id, session=session)
+
+    # пока строился индекс, пользователь успел напечатать дальше - отвечать уже некому
+    if not lookup.is_latest(tg_id, inline_query.id):
+        return
+
+    results = [
+        InlineQueryResultArticle(
+            id=str(task.id),
+            title=f"{PRIORITY_EMOJIS.get(task.priority, '⚪')} {task.name}",
+            description=task.description or None,
+            input_message_content=InputTextMessageContent(message_text=format_inline_task(task)),
+        )
+        for task in index.search(inline_query.query)
+    ]
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
@@ -1,7 +1,9 @@
 from aiogram.types import (ReplyKeyboardMarkup, KeyboardButton, Message,
                            InlineKeyboardMarkup, InlineKeyboardButton)
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram import Router
+from typing import Optional
 
 
 router = Router()
@@ -22,6 +24,7 @@ all_info = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text='Добавить задачу', callback_data = 'add task')],
     [InlineKeyboardButton(text='Список задач', callback_data = 'list task')],
     [InlineKeyboardButton(text='Задачи на сегодня', callback_data = 'task on today')],
+    [InlineKeyboardButton(text='Задачи на неделю', callback_data = 'task on week')],
     [InlineKeyboardButton(text='Категории задач', callback_data = 'category task')],
     [InlineKeyboardButton(text='Статистика', callback_data = 'stats')]
 ])
@@ -67,4 +70,24 @@ categories_kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text='➕ Создать категорию', callback_data='create_category')],
         [InlineKeyboardButton(text='🏠 Назад в меню', callback_data='back_to_menu')],
         [InlineKeyboardButton(text='🗑️ Удалить категорию', callback_data='delete_category')]
-])
\ No newline at end of file
+])
+
+class TasksPage(CallbackData, prefix='tp'):
+    direction: str
+    position: int
+    priority: int
+    id: int
+    deadline: Optional[str] = None
+
+
+class FindPage(CallbackData, prefix='fp'):
+    offset: int
+
+
+def tasks_page_kb(prev_page: Optional[CallbackData], next_page: Optional[CallbackData]):
+    row = []
+    if prev_page:
+        row.append(InlineKeyboardButton(text='◀️', callback_data=prev_page.pack()))
+    if next_page:
+        row.append(InlineKeyboardButton(text='▶️', callback_data=next_page.pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
@@ -0,0 +1,178 @@
+import logging
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+
+from database.models import track_queries
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+CALLBACK_LABEL_LIMIT = 32
+
+
+@dataclass
+class _Series:
+    counts: List[int]
+    sum: float = 0.0
+    count: int = 0
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series([0] * (len(self.buckets) + 1))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(self._series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip((*map(_format_bound, self.buckets), '+Inf'), series.counts):
+                cumulative += count
+                bucket_labels = ','.join([*labels, f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            label_text = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f'{self.name}_sum{label_text} {series.sum}')
+            lines.append(f'{self.name}_count{label_text} {series.count}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound: float) -> str:
+    return str(float(bound))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.update_duration = Histogram(
+            'bot_update_duration_seconds', 'Время обработки апдейта',
+            DURATION_BUCKETS, ('handler', 'callback'))
+        self.update_statements = Histogram(
+            'bot_update_db_statements', 'SQL-запросов на один апдейт',
+            STATEMENT_BUCKETS, ('handler',))
+        self.update_db_seconds = Histogram(
+            'bot_update_db_seconds', 'Время в SQL-запросах на один апдейт',
+            DURATION_BUCKETS, ('handler',))
+
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.update_duration, self.update_statements, self.update_db_seconds):
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+
+@dataclass
+class UpdateRecord:
+    handler: str = 'unhandled'
+    callback: str = ''
+
+
+def callback_label(data: Optional[str]) -> str:
+    # у CallbackData вида "tp:n:3:..." меняются только значения, префикс хватает для метки
+    if not data:
+        return ''
+    prefix, separator, _ = data.partition(':')
+    return (prefix if separator else data)[:CALLBACK_LABEL_LIMIT]
+
+
+# внешний middleware на update меряет весь апдейт вместе с SQL-запросами,
+# а внутренний на событиях узнает, какой обработчик сработал
+class MetricsMiddleware(BaseMiddleware):
+    def __init__(self, registry: MetricsRegistry, slow_threshold: float = 0.5):
+        self.registry = registry
+        self.slow_threshold = slow_threshold
+
+    def setup(self, dp: Dispatcher):
+        dp.update.outer_middleware(self)
+        for name, observer in dp.observers.items():
+            if name not in ('update', 'error'):
+                observer.middleware(self.label_handler)
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        record = UpdateRecord()
+        if event.callback_query is not None:
+            record.callback = callback_label(event.callback_query.data)
+        data['update_record'] = record
+
+        started = time.perf_counter()
+        with track_queries() as queries:
+            try:
+                return await handler(event, data)
+            finally:
+                self.observe(event, record, time.perf_counter() - started, queries)
+
+    async def label_handler(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        record = data.get('update_record')
+        if record is not None:
+            record.handler = data['handler'].callback.__name__
+        return await handler(event, data)
+
+    def observe(self, update: Update, record: UpdateRecord, duration: float, queries):
+        self.registry.update_duration.observe(duration, handler=record.handler, callback=record.callback)
+        self.registry.update_statements.observe(queries.statements, handler=record.handler)
+        self.registry.update_db_seconds.observe(queries.seconds, handler=record.handler)
+
+        if duration >= self.slow_threshold:
+            logger.warning('Медленный апдейт %s: %s%s за %.0f мс, SQL-запросов %s (%.0f мс)',
+                           update.update_id, record.handler,
+                           f' [{record.callback}]' if record.callback else '',
+                           duration * 1000, queries.statements, queries.seconds * 1000)
+
+
+class MetricsServer:
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info('Метрики доступны на http://%s:%s/metrics', self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from database.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+LANE_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+# по умолчанию все отправки считаются ответами пользователю;
+# рассылки и напоминания оборачиваются в bulk_lane()
+_current_lane: ContextVar[int] = ContextVar('outbound_lane', default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane():
+    token = _current_lane.set(BULK)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+@dataclass
+class LaneMetrics:
+    sent: int = 0
+    waiting: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+
+@dataclass
+class OutboundMetrics:
+    lanes: Dict[int, LaneMetrics] = field(default_factory=lambda: {lane: LaneMetrics() for lane in LANE_NAMES})
+    retries: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(lane.waiting for lane in self.lanes.values())
+
+
+# общий лимит Telegram (~30 сообщений в секунду) и лимит на чат (~1 в секунду);
+# общий лимит раздается по приоритету, поэтому ответы пользователям обгоняют рассылки
+class OutboundScheduler:
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_chats: int = 10_000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.metrics = OutboundMetrics()
+        self._chats = LRUCache(maxsize=max_chats)
+        self._waiters: List[Any] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, chat_id: Optional[Any], lane: int = INTERACTIVE):
+        lane_metrics = self.metrics.lanes[lane]
+        started = time.monotonic()
+        lane_metrics.waiting += 1
+        try:
+            if chat_id is not None:
+                bucket = self._chat_bucket(chat_id)
+                while (delay := bucket.delay()) > 0:
+                    await asyncio.sleep(delay)
+                bucket.take()
+
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (lane, next(self._sequence), future))
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = asyncio.create_task(self._dispatch())
+            await future
+        finally:
+            lane_metrics.waiting -= 1
+
+        waited = time.monotonic() - started
+        lane_metrics.sent += 1
+        lane_metrics.wait_total += waited
+        lane_metrics.wait_max = max(lane_metrics.wait_max, waited)
+
+    def retry_after(self, chat_id: Optional[Any], seconds: float):
+        self.metrics.retries += 1
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+        else:
+            self.global_bucket.pause(seconds)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _dispatch(self):
+        while self._waiters:
+            delay = self.global_bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.global_bucket.take()
+            future.set_result(None)
+
+
+class ThrottledSession(AiohttpSession):
+    def __init__(self, scheduler: OutboundScheduler = None, max_retries: int = 3, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler or OutboundScheduler()
+        self.max_retries = max_retries
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await super().make_request(bot, method, timeout=timeout)
+
+        lane = _current_lane.get()
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(chat_id, lane)
+            try:
+                return await super().make_request(bot, method, timeout=timeout)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning('Flood control в чате %s, повтор через %s с', chat_id, e.retry_after)
+                self.scheduler.retry_after(chat_id, e.retry_after)
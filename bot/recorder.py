@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+RECORD_FILE_NAME = 'updates.ndjson'
+
+# объекты User и Chat внутри апдейта: у них подменяется id и убираются имена
+_PERSON_KEYS = ('from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat', 'via_bot')
+_PERSONAL_FIELDS = ('first_name', 'last_name', 'username', 'title', 'phone_number', 'bio')
+
+
+class IdAnonymizer:
+    def __init__(self, salt: str = None):
+        # без секретной соли id телеграма легко перебрать по хэшу
+        self.salt = (salt or secrets.token_hex(16)).encode()
+
+    def anonymize_id(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(abs(value)).encode(), hashlib.sha256).digest()
+        # 48 бит хватает, чтобы не было коллизий, и влезает в BigInteger
+        anonymous = int.from_bytes(digest[:6], 'big') + 1
+        return -anonymous if value < 0 else anonymous
+
+    def anonymize(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        return self._walk(update)
+
+    def _walk(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._walk(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        result = {}
+        for key, item in value.items():
+            if key in _PERSON_KEYS and isinstance(item, dict):
+                item = self._person(item)
+            elif key == 'chat_instance':
+                item = str(self.anonymize_id(int(item)))
+            result[key] = self._walk(item)
+        return result
+
+    def _person(self, person: Dict[str, Any]) -> Dict[str, Any]:
+        person = {key: value for key, value in person.items() if key not in _PERSONAL_FIELDS}
+        person['id'] = self.anonymize_id(person['id'])
+        if person.get('type', 'private') == 'private':
+            person['first_name'] = f"User {person['id']}"
+        else:
+            person['title'] = f"Chat {person['id']}"
+        return person
+
+
+# пишет входящие апдейты в NDJSON: одна строка {"t": время, "u": апдейт} на апдейт,
+# по достижении max_bytes файл уходит в updates.ndjson.1, .2 и т.д., как у RotatingFileHandler
+class UpdateRecorder(BaseMiddleware):
+    def __init__(self, directory: Union[str, Path], max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, salt: str = None):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / RECORD_FILE_NAME
+        self.anonymizer = IdAnonymizer(salt)
+        self._handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backup_count,
+                                            encoding='utf-8')
+        self._handler.setFormatter(logging.Formatter('%(message)s'))
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        try:
+            self.record(event)
+        except Exception:
+            # запись нужна только для профилирования и не должна ронять обработку
+            logger.exception('Не удалось записать апдейт %s', event.update_id)
+        return await handler(event, data)
+
+    def record(self, update: Update, timestamp: float = None):
+        payload = self.anonymizer.anonymize(update.model_dump(mode='json', exclude_none=True, by_alias=True))
+        line = json.dumps({'t': round(timestamp or time.time(), 3), 'u': payload},
+                          ensure_ascii=False, separators=(',', ':'))
+        self._handler.emit(logging.makeLogRecord({'msg': line}))
+
+    def close(self):
+        self._handler.close()
+
+
+def record_files(path: Union[str, Path]) -> List[Path]:
+    # ротированные файлы идут от старых к новым: updates.ndjson.5, ..., .1, затем текущий
+    path = Path(path)
+    if path.is_dir():
+        path = path / RECORD_FILE_NAME
+    rotated = [file for file in path.parent.glob(f'{path.name}.*') if file.suffix[1:].isdigit()]
+    rotated.sort(key=lambda file: int(file.suffix[1:]), reverse=True)
+    return [*rotated, *([path] if path.exists() else [])]
+
+
+def read_records(paths: List[Union[str, Path]]) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        for file in record_files(path):
+            with open(file, encoding='utf-8') as records:
+                for line in records:
+                    if line.strip():
+                        yield json.loads(line)
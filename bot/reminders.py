@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.outbound import bulk_lane
+from database.requests import (UpcomingDeadline, add_task_listener, get_upcoming_deadlines,
+                               mark_reminder_sent, remove_task_listener)
+
+logger = logging.getLogger(__name__)
+
+HeapEntry = Tuple[datetime, int, UpcomingDeadline]
+
+
+# держит в куче только дедлайны из ближайшего окна и спит до ближайшего из них;
+# изменения задач приходят через подписку на database.requests, а окно
+# периодически перечитывается из базы по индексу на deadline
+class ReminderScheduler:
+    def __init__(self, bot: Bot, session_pool: async_sessionmaker,
+                 advance: timedelta = timedelta(minutes=15),
+                 window: timedelta = timedelta(hours=24),
+                 refresh_interval: timedelta = timedelta(hours=1),
+                 catch_up: timedelta = timedelta(hours=12),
+                 retry_delay: timedelta = timedelta(minutes=1),
+                 max_attempts: int = 3):
+        self.bot = bot
+        self.session_pool = session_pool
+        self.advance = advance
+        self.window = window
+        self.refresh_interval = refresh_interval
+        self.catch_up = catch_up
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self._heap: List[HeapEntry] = []
+        self._entries: Dict[int, HeapEntry] = {}
+        self._window_end: Optional[datetime] = None
+        self._reload_logs: List[list] = []
+        # неудачные отправки: число попыток и время следующей
+        self._retries: Dict[int, Tuple[int, datetime]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        add_task_listener(self.on_task_event)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        remove_task_listener(self.on_task_event)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def reload(self):
+        now = datetime.now()
+        # напоминания, пропущенные пока бот был выключен, тоже попадут в кучу
+        start = now - self.catch_up
+        self._window_end = now + self.advance + self.window
+        # события, пришедшие во время запроса, могли не попасть в его результат
+        log = []
+        self._reload_logs.append(log)
+        try:
+            async with self.session_pool() as session:
+                upcoming = await get_upcoming_deadlines(start, self._window_end, session=session)
+        finally:
+            self._reload_logs.remove(log)
+
+        self._heap = []
+        self._entries = {}
+        for item in upcoming:
+            retry = self._retries.get(item.task_id)
+            self._push(item, due=retry[1] if retry else None)
+        for event, task_id, payload in log:
+            self._apply_event(event, task_id, payload)
+
+    def on_task_event(self, event: str, task_id: int, **payload):
+        for log in self._reload_logs:
+            log.append((event, task_id, payload))
+        self._apply_event(event, task_id, payload)
+        self._wakeup.set()
+
+    def _apply_event(self, event: str, task_id: int, payload: dict):
+        if event == 'created':
+            deadline = payload.get('deadline')
+            if deadline is None or self._window_end is None or deadline >= self._window_end:
+                return
+            # как и в reload: слишком давние дедлайны не напоминаем
+            if deadline < datetime.now() - self.catch_up:
+                return
+            self._push(UpcomingDeadline(task_id, payload['tg_id'], payload['name'], deadline))
+        else:
+            self._entries.pop(task_id, None)
+            self._retries.pop(task_id, None)
+
+    def pop_due(self, now: datetime) -> List[UpcomingDeadline]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[1]) is entry:
+                del self._entries[entry[1]]
+                due.append(entry[2])
+        return due
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap and self._entries.get(self._heap[0][1]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    async def send(self, item: UpcomingDeadline):
+        if item.deadline <= datetime.now():
+            text = f"⏰ Срок задачи «{item.name}» истек {item.deadline.strftime('%d.%m.%Y %H:%M')}"
+        else:
+            text = f"⏰ Напоминание: задача «{item.name}» — срок {item.deadline.strftime('%d.%m.%Y %H:%M')}"
+
+        try:
+            with bulk_lane():
+                await self.bot.send_message(item.tg_id, text)
+        except Exception:
+            attempts = self._retries[item.task_id][0] + 1 if item.task_id in self._retries else 1
+            if attempts < self.max_attempts:
+                logger.exception('Не удалось отправить напоминание по задаче %s, попытка %s',
+                                 item.task_id, attempts)
+                retry_at = datetime.now() + self.retry_delay * attempts
+                self._retries[item.task_id] = (attempts, retry_at)
+                self._push(item, due=retry_at)
+                return
+            # дальше не повторяем, иначе каждый reload снова вернет задачу в кучу
+            logger.exception('Напоминание по задаче %s не отправлено после %s попыток',
+                             item.task_id, attempts)
+
+        self._retries.pop(item.task_id, None)
+        async with self.session_pool() as session:
+            await mark_reminder_sent(item.task_id, session=session)
+
+    def _push(self, item: UpcomingDeadline, due: Optional[datetime] = None):
+        entry = (due or item.deadline - self.advance, item.task_id, item)
+        self._entries[item.task_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reload()
+                refresh_at = datetime.now() + self.refresh_interval
+                while datetime.now() < refresh_at:
+                    for item in self.pop_due(datetime.now()):
+                        await self.send(item)
+
+                    next_due = self.next_due()
+                    wake_at = min(next_due, refresh_at) if next_due else refresh_at
+                    self._wakeup.clear()
+                    try:
+                        timeout = max((wake_at - datetime.now()).total_seconds(), 0)
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Ошибка в планировщике напоминаний')
+                await asyncio.sleep(5)
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Optional
+
+from database.cache import LRUCache
+
+RENDER_CACHE_SIZE = 10_000
+
+LIST_SCREEN = 'list'
+TODAY_SCREEN = 'today'
+STATS_SCREEN = 'stats'
+
+
+@dataclass
+class RenderCacheMetrics:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass(frozen=True)
+class RenderEntry:
+    version: int
+    day: Optional[date]
+    value: Any
+
+
+# готовые тексты экранов; запись годится, пока не изменилась версия данных пользователя.
+# для экранов, зависящих от даты, в запись кладется день, так что после полуночи она устаревает
+class RenderCache:
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.metrics = RenderCacheMetrics()
+        self._entries = LRUCache(maxsize=maxsize)
+
+    def get(self, tg_id: int, screen: str, version: int, day: date = None) -> Optional[RenderEntry]:
+        entry = self._entries.get((tg_id, screen))
+        if entry is None or entry.version != version or entry.day != day:
+            self.metrics.misses += 1
+            return None
+        self.metrics.hits += 1
+        return entry
+
+    def set(self, tg_id: int, screen: str, version: int, value, day: date = None):
+        self._entries.set((tg_id, screen), RenderEntry(version, day, value))
+
+    def clear(self):
+        self._entries.clear()
+        self.metrics = RenderCacheMetrics()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+render_cache = RenderCache()
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import FSMRecord, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    touched: float = field(default_factory=time.monotonic)
+
+
+# FSM-хранилище в таблице fsm_states: чтения и записи идут через память,
+# изменения сбрасываются в базу пачкой раз в flush_interval секунд,
+# а сценарии, которые не трогали дольше ttl, удаляются и из памяти, и из базы
+class SQLiteStorage(BaseStorage):
+    def __init__(self, session_pool: async_sessionmaker, ttl: float = 24 * 60 * 60,
+                 flush_interval: float = 1.0):
+        self.session_pool = session_pool
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._records: Dict[str, _Record] = {}
+        self._dirty = set()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+
+        keys, self._dirty = self._dirty, set()
+        now = datetime.now()
+        upserts, deletes = [], []
+        for key in keys:
+            record = self._records.get(key)
+            if record is None or (record.state is None and not record.data):
+                deletes.append(key)
+            else:
+                upserts.append({'key': key, 'state': record.state,
+                                'data': json.dumps(record.data, ensure_ascii=False), 'updated_at': now})
+
+        try:
+            async with self.session_pool() as session:
+                if upserts:
+                    statement = dialect_insert(session, FSMRecord)
+                    await session.execute(statement.on_conflict_do_update(
+                        index_elements=[FSMRecord.key],
+                        set_={'state': statement.excluded.state, 'data': statement.excluded.data,
+                              'updated_at': statement.excluded.updated_at}
+                    ), upserts)
+                if deletes:
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+                await session.commit()
+        except Exception:
+            # не теряем изменения: попробуем записать их при следующем сбросе
+            self._dirty |= keys
+            raise
+
+    async def evict_expired(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        for key in [key for key, record in self._records.items() if record.touched < deadline]:
+            del self._records[key]
+            self._dirty.discard(key)
+
+        async with self.session_pool() as session:
+            await session.execute(
+                delete(FSMRecord).where(FSMRecord.updated_at < datetime.now() - timedelta(seconds=self.ttl))
+            )
+            await session.commit()
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        storage_key = self._storage_key(key)
+        record = self._records.get(storage_key)
+        if record is None:
+            loaded = await self._load(storage_key)
+            # пока шла загрузка, запись могла появиться в памяти
+            record = self._records.setdefault(storage_key, loaded)
+        record.touched = time.monotonic()
+        return record
+
+    async def _load(self, key: str) -> _Record:
+        async with self.session_pool() as session:
+            row = await session.scalar(select(FSMRecord).where(FSMRecord.key == key))
+
+        if row is None or row.updated_at < datetime.now() - timedelta(seconds=self.ttl):
+            return _Record()
+        return _Record(state=row.state, data=json.loads(row.data) if row.data else {})
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(self._storage_key(key))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        last_eviction = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_eviction >= min(self.ttl, 60):
+                    await self.evict_expired()
+                    last_eviction = time.monotonic()
+            except Exception:
+                logger.exception('Не удалось сохранить FSM-состояния')
+
+    @staticmethod
+    def _storage_key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
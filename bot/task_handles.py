@@ -0,0 +1,43 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+
+from database.cache import LRUCache
+
+SNAPSHOT_CACHE_SIZE = 10_000
+
+
+class StaleSnapshot(Exception):
+    pass
+
+
+@dataclass
+class TaskListSnapshot:
+    version: int
+    task_ids: Dict[int, int] = field(default_factory=dict)
+
+
+# что именно пользователь видел в показанных страницах списка: позиция -> id задачи
+_snapshots = LRUCache(maxsize=SNAPSHOT_CACHE_SIZE)
+
+
+def remember_task_list(tg_id: int, positions: Iterable[Tuple[int, int]], version: int):
+    snapshot = _snapshots.get(tg_id)
+    if snapshot is None or snapshot.version != version:
+        snapshot = TaskListSnapshot(version)
+        _snapshots.set(tg_id, snapshot)
+    snapshot.task_ids.update(positions)
+
+
+def resolve_task_handles(tg_id: int, positions: Iterable[int], version: int) -> Dict[int, Optional[int]]:
+    # все позиции сверяются с одной и той же версией снимка
+    snapshot = _snapshots.get(tg_id)
+    if snapshot is None or snapshot.version != version:
+        raise StaleSnapshot()
+    return {position: snapshot.task_ids.get(position) for position in positions}
+
+
+def rebase_snapshot(tg_id: int, version: int):
+    # изменение прошло через сам снимок, поэтому позиции в показанном списке остаются верными
+    snapshot = _snapshots.get(tg_id)
+    if snapshot is not None:
+        snapshot.version = version
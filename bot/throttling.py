@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject, Update
+
+from bot.outbound import TokenBucket
+from database.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# флаг обработчиков, которые грузят из базы полные списки или статистику:
+# @router.message(..., flags=DB_HEAVY); сама загрузка внутри обработчика
+# оборачивается в db_slot(), ответ в Telegram идет уже без слота
+DB_HEAVY = {'db_heavy': True}
+
+FLOOD_WARNING = '⏳ Слишком много запросов, подождите пару секунд'
+
+# middleware, под лимитом которого идет текущий тяжелый обработчик; выставляется в limit_db
+_db_limiter: ContextVar[Optional['FloodControlMiddleware']] = ContextVar('db_limiter', default=None)
+
+
+@asynccontextmanager
+async def db_slot():
+    # вне обработчика с DB_HEAVY (фоновые задачи, тесты) ограничения нет
+    limiter = _db_limiter.get()
+    if limiter is None:
+        yield
+        return
+    async with limiter.db_slot():
+        yield
+
+
+@dataclass
+class _UserLimit:
+    bucket: TokenBucket
+    warned: bool = False
+
+
+@dataclass
+class FloodMetrics:
+    throttled: int = 0
+    collapsed: int = 0
+    db_waiting: int = 0
+
+
+# внешний middleware на update: лимит апдейтов на пользователя и склейка одинаковых нажатий,
+# внутренний на событиях: общий лимит одновременных тяжелых запросов к базе.
+# Inline-запросы в лимит апдейтов не входят: Telegram шлет их на каждую набранную букву,
+# а устаревшие и так отбрасываются в bot/inline.py
+class FloodControlMiddleware(BaseMiddleware):
+    def __init__(self, rate: float = 2, burst: float = 5, db_concurrency: int = 4,
+                 max_users: int = 10_000, idle_ttl: float = 600):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self.metrics = FloodMetrics()
+        self._users = LRUCache(maxsize=max_users)
+        self._in_flight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._db_semaphore = asyncio.Semaphore(db_concurrency)
+
+    def setup(self, dp: Dispatcher):
+        dp.update.outer_middleware(self)
+        for observer in (dp.message, dp.callback_query, dp.inline_query):
+            observer.middleware(self.limit_db)
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None or event.inline_query is not None:
+            return await handler(event, data)
+
+        callback = event.callback_query
+        key = (user.id, callback.data) if callback is not None and callback.data else None
+        if key is not None and key in self._in_flight:
+            # то же нажатие еще обрабатывается: ждем его, а не считаем заново
+            self.metrics.collapsed += 1
+            result = await asyncio.shield(self._in_flight[key])
+            await self._answer(callback)
+            return result
+
+        if not self.allow(user.id):
+            self.metrics.throttled += 1
+            await self._reject(event, user.id)
+            return UNHANDLED
+
+        if key is None:
+            return await handler(event, data)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await handler(event, data)
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+            if not future.done():
+                # ошибку получит только первое нажатие, повторы просто завершаются
+                future.set_result(UNHANDLED)
+
+    async def limit_db(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, 'db_heavy'):
+            return await handler(event, data)
+
+        token = _db_limiter.set(self)
+        try:
+            return await handler(event, data)
+        finally:
+            _db_limiter.reset(token)
+
+    @asynccontextmanager
+    async def db_slot(self):
+        self.metrics.db_waiting += 1
+        try:
+            await self._db_semaphore.acquire()
+        finally:
+            self.metrics.db_waiting -= 1
+        try:
+            yield
+        finally:
+            self._db_semaphore.release()
+
+    def allow(self, user_id: int) -> bool:
+        self._evict_idle()
+        limit = self._users.get(user_id)
+        if limit is None:
+            limit = _UserLimit(TokenBucket(self.rate, self.burst))
+            self._users.set(user_id, limit)
+
+        if limit.bucket.delay() > 0:
+            return False
+        limit.bucket.take()
+        limit.warned = False
+        return True
+
+    def _evict_idle(self):
+        # за idle_ttl ведро успевает наполниться, хранить его дальше незачем;
+        # записи упорядочены по последнему обращению, поэтому смотрим только с начала
+        now = time.monotonic()
+        while (oldest := self._users.oldest()) is not None and now - oldest[1].bucket.updated > self.idle_ttl:
+            self._users.pop(oldest[0])
+
+    async def _reject(self, update: Update, user_id: int):
+        limit = self._users.get(user_id)
+        if update.callback_query is not None:
+            await self._answer(update.callback_query, FLOOD_WARNING)
+        elif update.message is not None and not limit.warned:
+            # предупреждаем один раз за серию, остальные сообщения молча пропускаются
+            limit.warned = True
+            try:
+                await update.message.answer(FLOOD_WARNING)
+            except Exception:
+                logger.exception('Не удалось предупредить пользователя %s о лимите', user_id)
+
+    @staticmethod
+    async def _answer(callback, text: str = None):
+        try:
+            await callback.answer(text)
+        except Exception:
+            # на устаревший callback Telegram отвечает ошибкой, обработке это не мешает
+            logger.debug('Не удалось ответить на callback %s', callback.id, exc_info=True)
+
+    @property
+    def tracked_users(self) -> int:
+        return len(self._users)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import secrets
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+# принимает апдейты от Telegram, сразу отвечает 200 и отдает их пулу воркеров;
+# если очередь заполнена, запрос ждет свободного места, и Telegram сам притормаживает
+class WebhookServer:
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str],
+                 workers: int = 32, queue_size: int = 1000, **workflow_data: Any):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.workers = workers
+        self.workflow_data = workflow_data
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+
+    def make_app(self, path: str = '/webhook') -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and not secrets.compare_digest(
+                request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+
+        await self.queue.put(update)
+        return web.Response()
+
+    async def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        await self.queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update, **self.workflow_data)
+            except Exception:
+                logger.exception('Ошибка при обработке апдейта %s', update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def _on_startup(self, app: web.Application):
+        await self.start()
+
+    async def _on_shutdown(self, app: web.Application):
+        await self.stop()
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, url: str, path: str, host: str, port: int,
+                      secret_token: Optional[str] = None, workers: int = 32, queue_size: int = 1000):
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    workflow_data: Dict[str, Any] = {'dispatcher': dispatcher, **dispatcher.workflow_data}
+    server = WebhookServer(dispatcher, bot, secret_token, workers=workers,
+                           queue_size=queue_size, **workflow_data)
+
+    runner = web.AppRunner(server.make_app(path))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    await dispatcher.emit_startup(bot=bot, **workflow_data)
+    await bot.set_webhook(
+        url.rstrip('/') + path,
+        secret_token=secret_token,
+        allowed_updates=dispatcher.resolve_used_update_types()
+    )
+    logger.info('Webhook запущен на %s:%s%s', host, port, path)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await dispatcher.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+
+from database.migrations import backfill_completed_at, backfill_task_categories
+from database.models import create_tables, rebuild_search_index
+
+
+# обслуживание базы: python -m database.manage <команда>
+async def rebuild_search():
+    await create_tables()
+    await rebuild_search_index()
+    print('Поисковый индекс перестроен')
+
+
+async def backfill_categories():
+    await create_tables()
+    moved = await backfill_task_categories()
+    print(f'Категории перенесены у {moved} задач')
+
+
+async def backfill_completed():
+    await create_tables()
+    filled = await backfill_completed_at()
+    print(f'Время выполнения заполнено у {filled} задач')
+
+
+COMMANDS = {
+    'rebuild-search': rebuild_search,
+    'backfill-categories': backfill_categories,
+    'backfill-completed': backfill_completed,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m database.manage')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    args = parser.parse_args(argv)
+    asyncio.run(COMMANDS[args.command]())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import logging
+
+from sqlalchemy import and_, select, tuple_, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import CATEGORY_NAME_LIMIT, Category, Task, async_session, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+async def backfill_task_categories(session_pool: async_sessionmaker = async_session,
+                                   chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+    # переносит текстовую категорию задач в category_id порциями, каждая в своей транзакции,
+    # чтобы не держать блокировку на всей таблице; повторный запуск продолжает с места остановки
+    moved = 0
+    last_id = 0
+    while True:
+        async with session_pool() as session:
+            rows = (await session.execute(
+                select(Task.id, Task.user_id, Task.legacy_category)
+                .where(Task.legacy_category.isnot(None), Task.id > last_id)
+                .order_by(Task.id)
+                .limit(chunk_size)
+            )).all()
+            if not rows:
+                break
+
+            names = {(row.user_id, row.legacy_category[:CATEGORY_NAME_LIMIT]) for row in rows}
+            await session.execute(
+                dialect_insert(session, Category)
+                .values([{'tg_id': tg_id, 'name': name} for tg_id, name in names])
+                .on_conflict_do_nothing(index_elements=[Category.tg_id, Category.name])
+            )
+            category_ids = {
+                (tg_id, name): category_id
+                for category_id, tg_id, name in await session.execute(
+                    select(Category.id, Category.tg_id, Category.name)
+                    .where(tuple_(Category.tg_id, Category.name).in_(names))
+                )
+            }
+
+            await session.execute(update(Task), [
+                {
+                    'id': row.id,
+                    'category_id': category_ids[(row.user_id, row.legacy_category[:CATEGORY_NAME_LIMIT])],
+                    'legacy_category': None,
+                }
+                for row in rows
+            ])
+            await session.commit()
+
+        moved += len(rows)
+        last_id = rows[-1].id
+        logger.info('Категории перенесены у %s задач', moved)
+
+    return moved
+
+
+async def backfill_completed_at(session_pool: async_sessionmaker = async_session,
+                                chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+    # у задач, выполненных до появления completed_at, время выполнения неизвестно;
+    # берем время создания, как раньше делал архиватор, чтобы он мог искать по индексу
+    filled = 0
+    while True:
+        async with session_pool() as session:
+            task_ids = (await session.execute(
+                select(Task.id)
+                .where(and_(Task.is_completed == True, Task.completed_at.is_(None)))
+                .order_by(Task.id)
+                .limit(chunk_size)
+            )).scalars().all()
+            if not task_ids:
+                break
+
+            await session.execute(
+                update(Task).where(Task.id.in_(task_ids)).values(completed_at=Task.created_at)
+            )
+            await session.commit()
+
+        filled += len(task_ids)
+        logger.info('Время выполнения заполнено у %s задач', filled)
+
+    return filled
@@ -1,10 +1,110 @@
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine, AsyncSession
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, BigInteger, ForeignKey
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine, AsyncSession, AsyncEngine
+from sqlalchemy import (Column, Integer, String, Text, DateTime, Boolean, BigInteger, ForeignKey, Index, event,
+                        inspect)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, table, column, literal_column
+from bot.config import (DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                        DB_ECHO, SQLITE_PRAGMAS)
 
-engine = create_async_engine(url='sqlite+aiosqlite:///db.sqlite3')
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    seconds: float = 0.0
+    closed: bool = False
+
+
+# счетчик запросов текущего апдейта; фоновые задачи, запущенные из обработчика,
+# наследуют контекст, поэтому после завершения апдейта счетчик закрывается
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+
+@contextmanager
+def track_queries():
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        stats.closed = True
+        _query_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = _query_stats.get()
+    if stats is not None and not stats.closed:
+        stats.statements += 1
+        stats.seconds += time.perf_counter() - started
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute для упавшего запроса не вызывается
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def build_engine(url: str = DATABASE_URL, pragmas: dict = SQLITE_PRAGMAS, pool_size: int = DB_POOL_SIZE,
+                 max_overflow: int = DB_MAX_OVERFLOW, pool_timeout: float = DB_POOL_TIMEOUT) -> AsyncEngine:
+    # без явного пула aiosqlite открывает новое соединение (и поток) на каждую сессию
+    engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=not url.startswith('sqlite')
+    )
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine.sync_engine, 'handle_error', _handle_error)
+
+    if engine.dialect.name == 'sqlite':
+        @event.listens_for(engine.sync_engine, 'connect')
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+            cursor.close()
+
+    return engine
+
+
+async def describe_engine(engine: AsyncEngine) -> dict:
+    settings = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'pool': engine.pool.status(),
+    }
+    if engine.dialect.name == 'sqlite':
+        async with engine.connect() as conn:
+            for name in SQLITE_PRAGMAS:
+                settings[name] = (await conn.exec_driver_sql(f'PRAGMA {name}')).scalar()
+    return settings
+
+
+def dialect_insert(session: AsyncSession, table):
+    # INSERT ... ON CONFLICT есть и в SQLite, и в PostgreSQL, но конструкторы у них разные
+    if session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+engine = build_engine()
 
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -23,34 +123,213 @@ class User(Base):
     def __repr__(self):
         return f"User(id={self.id}, telegram_id={self.tg_id}, username={self.username})"
 
+CATEGORY_NAME_LIMIT = 50
+
 class Category(Base):
     __tablename__ = 'categories'
 
     id: Mapped[int] = mapped_column(primary_key=True)
     tg_id = mapped_column(BigInteger)
-    name = Column(String(50))
+    name = Column(String(CATEGORY_NAME_LIMIT))
     color = Column(String(20), default="#3498db")
 
+    __table_args__ = (
+        Index('ix_categories_user_name', 'tg_id', 'name', unique=True),
+    )
+
+TASK_NAME_LIMIT = 200
+
 class Task(Base):
     __tablename__ = 'tasks'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.tg_id'))
-    name = Column(String(200), nullable=False)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.tg_id'))
+    name = Column(String(TASK_NAME_LIMIT), nullable=False)
     description = Column(Text)
-    category = Column(String(100))
+    category_id: Mapped[int] = mapped_column(ForeignKey('categories.id', ondelete='SET NULL'),
+                                             nullable=True, index=True)
+    # старая текстовая колонка: новые задачи ее не заполняют, миграция переносит из нее в category_id
+    legacy_category = Column('category', String(100))
     priority = Column(Integer, default=2)
     deadline = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     is_completed = Column(Boolean, default=False)
     completed_at = Column(DateTime, nullable=True)
 
+    category_ref = relationship(Category, lazy='joined')
+
+    __table_args__ = (
+        Index('ix_tasks_user_active_deadline', 'user_id', 'is_completed', 'deadline'),
+        Index('ix_tasks_user_active_order', 'user_id', 'is_completed', priority.desc(), 'deadline', 'id'),
+        Index('ix_tasks_active_deadline', 'is_completed', 'deadline'),
+        # архиватор выбирает выполненные задачи по времени выполнения
+        Index('ix_tasks_completed_at', 'is_completed', 'completed_at'),
+    )
+
+    @property
+    def category(self):
+        return self.category_ref.name if self.category_ref is not None else None
+
     def __repr__(self):
         return f"Tasks(id={self.id}, name={self.name}, priority={self.priority})"
 
+# выполненные задачи старше нескольких дней переезжают сюда, чтобы выборки активных задач
+# не просматривали растущую кучу завершенных строк. id свой: SQLite может выдать id
+# удаленной задачи новой, поэтому исходный id хранится отдельно в task_id
+class TaskArchive(Base):
+    __tablename__ = 'tasks_archive'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    user_id = mapped_column(BigInteger, nullable=False)
+    name = Column(String(200), nullable=False)
+    description = Column(Text)
+    category_id: Mapped[int] = mapped_column(ForeignKey('categories.id', ondelete='SET NULL'), nullable=True)
+    priority = Column(Integer, default=2)
+    deadline = Column(DateTime, nullable=True)
+    created_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    archived_at = Column(DateTime, server_default=func.now())
+
+    category_ref = relationship(Category, lazy='joined')
+
+    __table_args__ = (
+        Index('ix_tasks_archive_user_completed', 'user_id', 'completed_at'),
+    )
+
+    @property
+    def category(self):
+        return self.category_ref.name if self.category_ref is not None else None
+
+class UserStats(Base):
+    __tablename__ = 'user_stats'
+
+    tg_id = mapped_column(BigInteger, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    active_low = Column(Integer, nullable=False, default=0)
+    active_medium = Column(Integer, nullable=False, default=0)
+    active_high = Column(Integer, nullable=False, default=0)
+
+class TaskReminder(Base):
+    __tablename__ = 'task_reminders'
+
+    task_id: Mapped[int] = mapped_column(ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True)
+    sent_at = Column(DateTime, server_default=func.now())
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_states'
+
+    key = Column(String(200), primary_key=True)
+    state = Column(String(100), nullable=True)
+    data = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+# полнотекстовый индекс по названию и описанию задач. В SQLite это внешняя FTS5-таблица,
+# которую триггеры синхронизируют с tasks; в PostgreSQL - GIN-индекс по tsvector.
+# user_id тоже индексируется: фильтр по колонке user_id внутри MATCH отсекает чужие задачи
+# по самому индексу. UNINDEXED-колонку внешней таблицы FTS5 читала бы из tasks для каждого совпадения
+tasks_fts = table('tasks_fts', column('rowid'), column('name'), column('description'), column('user_id'))
+
+SEARCH_CONFIG = 'simple'
+
+SQLITE_SEARCH_TRIGGERS = ('tasks_fts_insert', 'tasks_fts_delete', 'tasks_fts_update')
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+    "name, description, user_id, content='tasks', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+    "INSERT INTO tasks_fts(rowid, name, description, user_id) "
+    "VALUES (new.id, new.name, new.description, new.user_id); END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+    "INSERT INTO tasks_fts(tasks_fts, rowid, name, description, user_id) "
+    "VALUES ('delete', old.id, old.name, old.description, old.user_id); END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF name, description ON tasks BEGIN "
+    "INSERT INTO tasks_fts(tasks_fts, rowid, name, description, user_id) "
+    "VALUES ('delete', old.id, old.name, old.description, old.user_id); "
+    "INSERT INTO tasks_fts(rowid, name, description, user_id) "
+    "VALUES (new.id, new.name, new.description, new.user_id); END",
+]
+
+def _postgres_search_vector(prefix: str = '') -> str:
+    return (f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({prefix}name, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({prefix}description, '')), 'B')")
+
+POSTGRES_SEARCH_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_tasks_search ON tasks USING gin (({_postgres_search_vector()}))",
+]
+
+
+def task_search_vector():
+    # выражение совпадает с выражением ix_tasks_search, иначе индекс не используется;
+    # вес A у названия выше, чем B у описания. Колонки с именем таблицы, потому что
+    # к задачам присоединяется categories, где тоже есть name
+    return literal_column(f"({_postgres_search_vector('tasks.')})")
+
+
 async def create_tables():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(setup_schema)
+
+def setup_schema(conn):
+    Base.metadata.create_all(conn)
+    _add_missing_columns(conn)
+    _merge_duplicate_categories(conn)
+    _create_missing_indexes(conn)
+    _create_search_index(conn)
+
+def _add_missing_columns(conn):
+    # create_all не меняет уже существующие таблицы
+    existing = {column['name'] for column in inspect(conn).get_columns('tasks')}
+    if 'category_id' not in existing:
+        conn.exec_driver_sql('ALTER TABLE tasks ADD COLUMN category_id INTEGER REFERENCES categories(id)')
+
+def _merge_duplicate_categories(conn):
+    # до уникального индекса одна и та же категория могла сохраниться дважды;
+    # задачи на категории тогда еще не ссылались, так что лишние строки просто удаляются
+    indexes = {index['name'] for index in inspect(conn).get_indexes('categories')}
+    if 'ix_categories_user_name' in indexes:
+        return
+    conn.exec_driver_sql(
+        'DELETE FROM categories WHERE id NOT IN (SELECT min(id) FROM categories GROUP BY tg_id, name)'
+    )
+
+def _create_missing_indexes(conn):
+    # create_all не добавляет индексы к уже существующим таблицам
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def _create_search_index(conn):
+    if conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+        return
+
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'").scalar()
+    if exists and 'user_id' not in {row[1] for row in conn.exec_driver_sql('PRAGMA table_info(tasks_fts)')}:
+        # индекс из версии без user_id: пересоздаем вместе с триггерами
+        for trigger in SQLITE_SEARCH_TRIGGERS:
+            conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.exec_driver_sql('DROP TABLE tasks_fts')
+        exists = False
+    for statement in SQLITE_SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+    if not exists:
+        # индекс добавлен к уже существующей базе - заполняем его текущими задачами
+        _rebuild_search_index(conn)
+
+def _rebuild_search_index(conn):
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('REINDEX INDEX ix_tasks_search')
+    else:
+        conn.exec_driver_sql("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+async def rebuild_search_index(target: AsyncEngine = None):
+    async with (target or engine).begin() as conn:
+        await conn.run_sync(_rebuild_search_index)
 
 async def get_session():
     async with async_session() as session:
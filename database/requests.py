@@ -1,195 +1,828 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, and_, desc, asc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import (select, update, delete, insert, and_, or_, desc, asc, func, literal, literal_column,
+                        union_all)
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from database.models import User, Category, Task, async_session
+from functools import partial
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypedDict
+from database.models import (User, Category, Task, TaskArchive, TaskReminder, UserStats, async_session,
+                             dialect_insert,
+                             tasks_fts, task_search_vector, SEARCH_CONFIG, CATEGORY_NAME_LIMIT)
+from database.cache import LRUCache
 
+KNOWN_USERS_CACHE_SIZE = 10_000
+DATA_VERSIONS_CACHE_SIZE = 10_000
+USE_STATS_COUNTERS = True
+
+PRIORITY_COUNTERS = {1: 'active_low', 2: 'active_medium', 3: 'active_high'}
+
+# порядок, в котором пользователь видит список задач
+TASK_LIST_ORDER = (desc(Task.priority), asc(Task.deadline).nulls_first(), asc(Task.id))
+TASK_LIST_REVERSED_ORDER = (asc(Task.priority), desc(Task.deadline).nulls_last(), desc(Task.id))
+
+TaskKey = Tuple[int, Optional[datetime], int]
+
+# tg_id пользователей, которые точно есть в таблице users
+_known_users = LRUCache(maxsize=KNOWN_USERS_CACHE_SIZE)
+
+# версия данных пользователя меняется при каждом изменении его задач;
+# значения берутся из одного счетчика, поэтому никогда не повторяются
+_data_versions = LRUCache(maxsize=DATA_VERSIONS_CACHE_SIZE)
+_version_clock = count(1)
+
+
+# подписчики на изменения задач (например, планировщик напоминаний)
+_task_listeners = []
+
+
+def add_task_listener(listener):
+    _task_listeners.append(listener)
+
+
+def remove_task_listener(listener):
+    if listener in _task_listeners:
+        _task_listeners.remove(listener)
+
+
+def _notify_task_listeners(event: str, **payload):
+    for listener in _task_listeners:
+        listener(event, **payload)
+
+
+def get_data_version(tg_id: int) -> int:
+    version = _data_versions.get(tg_id)
+    if version is None:
+        version = next(_version_clock)
+        _data_versions.set(tg_id, version)
+    return version
+
+
+def _bump_data_version(tg_id: int):
+    _data_versions.set(tg_id, next(_version_clock))
+
+
+@asynccontextmanager
+async def session_scope(session: AsyncSession = None):
+    if session is not None:
+        yield session
+        return
 
-async def get_or_create_user(tg_id: int, username: str = None, full_name: str = None):
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        yield session
+
+
+@asynccontextmanager
+async def read_scope(session: AsyncSession = None):
+    # у общей сессии апдейта транзакция иначе живет до конца обработчика и держит соединение
+    # из пула, пока ответ ждет своей очереди в Telegram; закрываем ее сразу после чтения
+    async with session_scope(session) as session:
+        try:
+            yield session
+        except BaseException:
+            await session.rollback()
+            raise
+        await session.commit()
 
-        if not user:
-            user = User(tg_id=tg_id, username=username, full_name=full_name)
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
+
+# операция записи получает сессию и список колбэков, которые нужно вызвать после коммита;
+# сама она не коммитит, поэтому несколько операций можно закоммитить одной транзакцией
+WriteOperation = Callable[[AsyncSession, list], Awaitable[Any]]
+
+
+async def _write(session: Optional[AsyncSession], operation: WriteOperation):
+    if _write_batcher is not None:
+        return await _write_batcher.submit(operation)
+
+    async with session_scope(session) as session:
+        return await _run_write(session, operation)
+
+
+async def _run_write(session: AsyncSession, operation: WriteOperation):
+    on_commit = []
+    try:
+        result = await operation(session, on_commit)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+
+    for callback in on_commit:
+        callback()
+    return result
+
+
+@dataclass
+class BatchMetrics:
+    batches: int = 0
+    operations: int = 0
+    fallbacks: int = 0
+    max_batch_size: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.operations / self.batches if self.batches else 0.0
+
+
+# групповой коммит: операции от разных обработчиков копятся max_delay секунд
+# (или до max_batch штук) и коммитятся одной транзакцией; каждый вызывающий
+# получает свой результат или свою ошибку
+class WriteBatcher:
+    def __init__(self, session_pool: async_sessionmaker, max_delay: float = 0.005, max_batch: int = 50):
+        self.session_pool = session_pool
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.metrics = BatchMetrics()
+        self._pending = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes = set()
+        self._lock = asyncio.Lock()
+
+    async def submit(self, operation: WriteOperation):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        started = time.monotonic()
+        try:
+            return await future
+        finally:
+            latency = time.monotonic() - started
+            self.metrics.latency_total += latency
+            self.metrics.latency_max = max(self.metrics.latency_max, latency)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._start_flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        flush = asyncio.create_task(self._flush(batch))
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch):
+        try:
+            async with self._lock:
+                self.metrics.batches += 1
+                self.metrics.operations += len(batch)
+                self.metrics.max_batch_size = max(self.metrics.max_batch_size, len(batch))
+
+                async with self.session_pool() as session:
+                    results = []
+                    on_commit = []
+                    try:
+                        for operation, _ in batch:
+                            results.append(await operation(session, on_commit))
+                        await session.commit()
+                    except Exception:
+                        await session.rollback()
+                        results = None
+
+                if results is not None:
+                    for callback in on_commit:
+                        callback()
+                    for (_, future), result in zip(batch, results):
+                        if not future.done():
+                            future.set_result(result)
+                    return
+
+                # одна из операций упала: повторяем пачку по одной, чтобы ошибка досталась только ее автору
+                self.metrics.fallbacks += 1
+                for operation, future in batch:
+                    async with self.session_pool() as session:
+                        try:
+                            result = await _run_write(session, operation)
+                        except Exception as e:
+                            if not future.done():
+                                future.set_exception(e)
+                        else:
+                            if not future.done():
+                                future.set_result(result)
+        finally:
+            # отмена или ошибка вне операций (например, в on_commit) не должна оставить
+            # вызывающих ждать вечно
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(asyncio.CancelledError())
+
+
+_write_batcher: Optional[WriteBatcher] = None
+
+
+def enable_write_batching(session_pool: async_sessionmaker = async_session, max_delay: float = 0.005,
+                          max_batch: int = 50) -> WriteBatcher:
+    global _write_batcher
+    _write_batcher = WriteBatcher(session_pool, max_delay=max_delay, max_batch=max_batch)
+    return _write_batcher
+
+
+async def disable_write_batching():
+    global _write_batcher
+    batcher, _write_batcher = _write_batcher, None
+    if batcher is not None:
+        await batcher.close()
+
+
+async def get_or_create_user(tg_id: int, username: str = None, full_name: str = None,
+                             session: AsyncSession = None):
+    async with session_scope(session) as session:
+        user = await session.scalar(
+            dialect_insert(session, User)
+            .values(tg_id=tg_id, username=username, full_name=full_name)
+            .on_conflict_do_nothing(index_elements=[User.tg_id])
+            .returning(User)
+        )
+        await session.commit()
+
+        if user is None:
+            user = await session.scalar(select(User).where(User.tg_id == tg_id))
+
+        _known_users.set(tg_id, True)
         return user
 
 
+async def ensure_user(session: AsyncSession, tg_id: int):
+    if _known_users.touch(tg_id):
+        return
+    await get_or_create_user(tg_id, session=session)
+
+
 async def create_task(
         tg_id: int,
         name: str,
         description: str = None,
         category: str = None,
         priority: int = 2,
-        deadline: datetime = None
+        deadline: datetime = None,
+        session: AsyncSession = None
 ):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
-
-        task = Task(
-            user_id=user.tg_id,
-            name=name,
-            description=description,
-            category=category,
-            priority=priority,
-            deadline=deadline
+    return await _write(session, partial(
+        _create_task, tg_id=tg_id, name=name, description=description,
+        category=category, priority=priority, deadline=deadline
+    ))
+
+
+async def _create_task(session: AsyncSession, on_commit: list, tg_id: int, name: str, description: str,
+                       category: str, priority: int, deadline: datetime):
+    if not _known_users.touch(tg_id):
+        await session.execute(
+            dialect_insert(session, User).values(tg_id=tg_id)
+            .on_conflict_do_nothing(index_elements=[User.tg_id])
         )
-        session.add(task)
-        await session.commit()
-        await session.refresh(task)
-        return task
+        on_commit.append(lambda: _known_users.set(tg_id, True))
+
+    task = Task(
+        user_id=tg_id,
+        name=name,
+        description=description,
+        category_id=await _get_or_create_category_id(session, tg_id, category) if category else None,
+        priority=priority,
+        deadline=deadline
+    )
+    session.add(task)
+    await _update_stats_counters(session, tg_id, {'total': 1, **_active_delta(priority, 1)})
+    await session.flush()
+    await session.refresh(task)
+
+    def committed():
+        _bump_data_version(tg_id)
+        _notify_task_listeners('created', task_id=task.id, tg_id=tg_id, name=task.name, deadline=task.deadline)
+
+    on_commit.append(committed)
+    return task
+
+
+async def _get_or_create_category_id(session: AsyncSession, tg_id: int, name: str) -> int:
+    name = name[:CATEGORY_NAME_LIMIT]
+    category_id = await session.scalar(
+        select(Category.id).where(and_(Category.tg_id == tg_id, Category.name == name))
+    )
+    if category_id is None:
+        category_id = await session.scalar(
+            dialect_insert(session, Category).values(tg_id=tg_id, name=name)
+            .on_conflict_do_update(index_elements=[Category.tg_id, Category.name], set_={'name': name})
+            .returning(Category.id)
+        )
+    return category_id
 
 
-async def get_user_tasks(tg_id: int, completed: bool = False, limit: int = None):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
+# списки задач нужны только для показа: вместо объектов Task с identity map и отслеживанием
+# изменений выбираются нужные колонки в неизменяемые кортежи; запись по-прежнему через ORM
+class TaskRow(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    category: Optional[str]
+    priority: int
+    deadline: Optional[datetime]
+    is_completed: bool
+
+
+def _select_task_rows():
+    return (
+        select(Task.id, Task.name, Task.description, Category.name.label('category'),
+               Task.priority, Task.deadline, Task.is_completed)
+        .select_from(Task)
+        .outerjoin(Category, Task.category_id == Category.id)
+    )
+
+
+def _task_rows(result) -> List[TaskRow]:
+    return list(map(TaskRow._make, result))
+
+
+async def get_user_tasks(tg_id: int, completed: bool = False, limit: int = None,
+                         session: AsyncSession = None) -> List[TaskRow]:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
 
-        query = select(Task).where(
-            and_(Task.user_id == user.tg_id, Task.is_completed == completed)
-        ).order_by(
-            desc(Task.priority),
-            asc(Task.deadline),
-            asc(Task.id))
+        query = _select_task_rows().where(
+            and_(Task.user_id == tg_id, Task.is_completed == completed)
+        ).order_by(*TASK_LIST_ORDER)
 
         if limit:
             query = query.limit(limit)
 
-        result = await session.execute(query)
-        return result.scalars().all()
+        return _task_rows(await session.execute(query))
+
+
+class TaskPage(NamedTuple):
+    tasks: List[TaskRow]
+    has_more: bool
+
+
+async def get_tasks_page(tg_id: int, after: TaskKey = None, before: TaskKey = None,
+                         page_size: int = 10, session: AsyncSession = None) -> TaskPage:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
+
+        query = _select_task_rows().where(and_(Task.user_id == tg_id, Task.is_completed == False))
+        if before is not None:
+            query = query.where(_before_key(*before)).order_by(*TASK_LIST_REVERSED_ORDER)
+        else:
+            if after is not None:
+                query = query.where(_after_key(*after))
+            query = query.order_by(*TASK_LIST_ORDER)
+
+        tasks = _task_rows(await session.execute(query.limit(page_size + 1)))
+
+        page = list(tasks[:page_size])
+        if before is not None:
+            page.reverse()
+        return TaskPage(page, len(tasks) > page_size)
+
+
+async def search_tasks(tg_id: int, query: str, offset: int = 0, page_size: int = 10,
+                       session: AsyncSession = None) -> TaskPage:
+    # каждое слово запроса ищется как префикс, так что «курс» находит «курсовую»
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return TaskPage([], False)
+
+    async with read_scope(session) as session:
+        if session.get_bind().dialect.name == 'postgresql':
+            ts_query = func.to_tsquery(literal_column(f"'{SEARCH_CONFIG}'"),
+                                       ' & '.join(f'{term}:*' for term in terms))
+            vector = task_search_vector()
+            statement = _select_task_rows().where(vector.op('@@')(ts_query))
+            relevance = desc(func.ts_rank(vector, ts_query))
+        else:
+            fts = literal_column('tasks_fts')
+            # чужие совпадения отсекаются еще в FTS, до соединения с tasks и сортировки
+            match = f'user_id : "{tg_id}" AND (' + ' '.join(f'"{term}"*' for term in terms) + ')'
+            # совпадение в названии весит больше, чем в описании, user_id на ранг не влияет;
+            # у bm25 меньше - лучше
+            matched = (
+                select(tasks_fts.c.rowid, func.bm25(fts, 10.0, 1.0, 0.0).label('rank'))
+                .where(fts.op('MATCH')(match))
+                .subquery()
+            )
+            statement = _select_task_rows().join(matched, matched.c.rowid == Task.id)
+            relevance = asc(matched.c.rank)
 
+        statement = (
+            statement.where(Task.user_id == tg_id)
+            .order_by(relevance, desc(Task.priority), asc(Task.id))
+            .offset(offset).limit(page_size + 1)
+        )
+        tasks = _task_rows(await session.execute(statement))
+        return TaskPage(tasks[:page_size], len(tasks) > page_size)
 
-async def get_tasks_for_today(tg_id: int):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
+
+def task_key(task) -> TaskKey:
+    return task.priority, task.deadline, task.id
+
+
+def _after_key(priority: int, deadline: Optional[datetime], task_id: int):
+    # задачи без дедлайна идут первыми внутри своего приоритета
+    if deadline is None:
+        same_priority = or_(Task.deadline.isnot(None), and_(Task.deadline.is_(None), Task.id > task_id))
+    else:
+        same_priority = or_(Task.deadline > deadline, and_(Task.deadline == deadline, Task.id > task_id))
+    return or_(Task.priority < priority, and_(Task.priority == priority, same_priority))
+
+
+def _before_key(priority: int, deadline: Optional[datetime], task_id: int):
+    if deadline is None:
+        same_priority = and_(Task.deadline.is_(None), Task.id < task_id)
+    else:
+        same_priority = or_(Task.deadline.is_(None), Task.deadline < deadline,
+                            and_(Task.deadline == deadline, Task.id < task_id))
+    return or_(Task.priority > priority, and_(Task.priority == priority, same_priority))
+
+
+async def get_tasks_in_range(tg_id: int, start: datetime, end: datetime,
+                             session: AsyncSession = None) -> List[TaskRow]:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
 
         result = await session.execute(
-            select(Task).where(
+            _select_task_rows().where(
                 and_(
-                    Task.user_id == user.tg_id,
-                    Task.is_completed == False
+                    Task.user_id == tg_id,
+                    Task.is_completed == False,
+                    Task.deadline >= start,
+                    Task.deadline < end
                 )
-            ).order_by(desc(Task.priority), asc(Task.created_at))
+            ).order_by(asc(Task.deadline), desc(Task.priority), asc(Task.id))
         )
-        tasks = result.scalars().all()
+        return _task_rows(result)
 
-        today_tasks = []
-        today = datetime.now().date()
 
-        for task in tasks:
-            if task.deadline and task.deadline.date() == today:
-                today_tasks.append(task)
+async def get_tasks_for_today(tg_id: int, session: AsyncSession = None):
+    start = datetime.combine(datetime.now().date(), datetime.min.time())
+    return await get_tasks_in_range(tg_id, start, start + timedelta(days=1), session=session)
 
-        return today_tasks
 
+async def get_tasks_for_week(tg_id: int, session: AsyncSession = None):
+    start = datetime.combine(datetime.now().date(), datetime.min.time())
+    return await get_tasks_in_range(tg_id, start, start + timedelta(days=7), session=session)
 
-async def complete_task(tg_id: int, task_id: int):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
 
-        await session.execute(
-            update(Task).where(
-                and_(Task.id == task_id, Task.user_id == user.tg_id)
-            ).values(is_completed=True, completed_at=datetime.now())
+class UpcomingDeadline(NamedTuple):
+    task_id: int
+    tg_id: int
+    name: str
+    deadline: datetime
+
+
+async def get_upcoming_deadlines(start: datetime, end: datetime, session: AsyncSession = None) -> List[UpcomingDeadline]:
+    async with read_scope(session) as session:
+        result = await session.execute(
+            select(Task.id, Task.user_id, Task.name, Task.deadline)
+            .outerjoin(TaskReminder, TaskReminder.task_id == Task.id)
+            .where(
+                and_(
+                    Task.is_completed == False,
+                    Task.deadline >= start,
+                    Task.deadline < end,
+                    TaskReminder.task_id.is_(None)
+                )
+            ).order_by(asc(Task.deadline))
         )
+        return [UpcomingDeadline(*row) for row in result]
+
+
+async def mark_reminder_sent(task_id: int, session: AsyncSession = None):
+    async with session_scope(session) as session:
+        await session.execute(dialect_insert(session, TaskReminder).values(task_id=task_id).on_conflict_do_nothing())
         await session.commit()
 
 
-async def delete_task(tg_id: int, task_id: int):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
+async def complete_task(tg_id: int, task_id: int, session: AsyncSession = None):
+    return (await complete_tasks(tg_id, [task_id], session=session)).get(task_id)
 
-        await session.execute(
-            delete(Task).where(and_(Task.id == task_id, Task.user_id == user.tg_id))
+
+async def complete_tasks(tg_id: int, task_ids: List[int], session: AsyncSession = None) -> Dict[int, str]:
+    return await _write(session, partial(_complete_tasks, tg_id=tg_id, task_ids=list(task_ids)))
+
+
+async def _complete_tasks(session: AsyncSession, on_commit: list, tg_id: int, task_ids: List[int]):
+    result = await session.execute(
+        update(Task).where(
+            and_(Task.id.in_(task_ids), Task.user_id == tg_id, Task.is_completed == False)
+        ).values(is_completed=True, completed_at=datetime.now())
+        .returning(Task.id, Task.name, Task.priority)
+    )
+    rows = result.all()
+    if not rows:
+        return {}
+
+    deltas = {'completed': len(rows)}
+    for row in rows:
+        for column, delta in _active_delta(row.priority, -1).items():
+            deltas[column] = deltas.get(column, 0) + delta
+    await _update_stats_counters(session, tg_id, deltas)
+
+    def committed():
+        _bump_data_version(tg_id)
+        for row in rows:
+            _notify_task_listeners('completed', task_id=row.id, tg_id=tg_id)
+
+    on_commit.append(committed)
+    return {row.id: row.name for row in rows}
+
+
+async def delete_task(tg_id: int, task_id: int, session: AsyncSession = None):
+    return (await delete_tasks(tg_id, [task_id], session=session)).get(task_id)
+
+
+async def delete_tasks(tg_id: int, task_ids: List[int], session: AsyncSession = None) -> Dict[int, str]:
+    return await _write(session, partial(_delete_tasks, tg_id=tg_id, task_ids=list(task_ids)))
+
+
+async def _delete_tasks(session: AsyncSession, on_commit: list, tg_id: int, task_ids: List[int]):
+    result = await session.execute(
+        delete(Task).where(and_(Task.id.in_(task_ids), Task.user_id == tg_id))
+        .returning(Task.id, Task.name, Task.is_completed, Task.priority)
+    )
+    rows = result.all()
+    if not rows:
+        return {}
+
+    deleted_ids = [row.id for row in rows]
+    # id в SQLite могут переиспользоваться, поэтому отметки о напоминаниях удаляем явно
+    await session.execute(delete(TaskReminder).where(TaskReminder.task_id.in_(deleted_ids)))
+
+    deltas = {'total': -len(rows)}
+    for row in rows:
+        if row.is_completed:
+            deltas['completed'] = deltas.get('completed', 0) - 1
+            continue
+        for column, delta in _active_delta(row.priority, -1).items():
+            deltas[column] = deltas.get(column, 0) + delta
+    await _update_stats_counters(session, tg_id, deltas)
+
+    def committed():
+        _bump_data_version(tg_id)
+        for task_id in deleted_ids:
+            _notify_task_listeners('deleted', task_id=task_id, tg_id=tg_id)
+
+    on_commit.append(committed)
+    return {row.id: row.name for row in rows}
+
+
+class Statistics(TypedDict):
+    total: int
+    completed: int
+    active: int
+    priorities: Dict[int, int]
+    categories: Dict[str, int]
+
+
+async def get_statistics(tg_id: int, with_categories: bool = True, session: AsyncSession = None) -> Statistics:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
+
+        if USE_STATS_COUNTERS and not with_categories:
+            return await _get_counted_statistics(session, tg_id)
+
+        return await _aggregate_statistics(session, tg_id)
+
+
+def _user_task_rows(tg_id: int):
+    # активная таблица и архив вместе: статистика и история видят все задачи пользователя
+    return union_all(
+        select(Task.is_completed.label('is_completed'), Task.priority.label('priority'),
+               Task.category_id.label('category_id'))
+        .where(Task.user_id == tg_id),
+        select(literal(True).label('is_completed'), TaskArchive.priority, TaskArchive.category_id)
+        .where(TaskArchive.user_id == tg_id)
+    ).subquery()
+
+
+async def _aggregate_statistics(session: AsyncSession, tg_id: int) -> Statistics:
+    # строк в ответе не больше, чем (выполнена/нет) x приоритет x категория
+    rows = _user_task_rows(tg_id)
+    result = await session.execute(
+        select(rows.c.is_completed, rows.c.priority, Category.name, func.count())
+        .select_from(rows)
+        .outerjoin(Category, rows.c.category_id == Category.id)
+        .group_by(rows.c.is_completed, rows.c.priority, Category.id, Category.name)
+    )
+
+    stats = Statistics(total=0, completed=0, active=0,
+                       priorities={1: 0, 2: 0, 3: 0}, categories={})
+    for is_completed, priority, category, count in result:
+        stats['total'] += count
+        if is_completed:
+            stats['completed'] += count
+            continue
+
+        stats['active'] += count
+        stats['priorities'][priority] = stats['priorities'].get(priority, 0) + count
+        if category:
+            stats['categories'][category] = stats['categories'].get(category, 0) + count
+
+    return stats
+
+
+async def _get_counted_statistics(session: AsyncSession, tg_id: int) -> Statistics:
+    counters = (await session.execute(
+        select(UserStats.total, UserStats.completed,
+               *(getattr(UserStats, column) for column in PRIORITY_COUNTERS.values()))
+        .where(UserStats.tg_id == tg_id)
+    )).first()
+    if counters is None:
+        return await _rebuild_stats_counters(session, tg_id)
+
+    priorities = {priority: getattr(counters, column) for priority, column in PRIORITY_COUNTERS.items()}
+    return Statistics(total=counters.total, completed=counters.completed,
+                      active=sum(priorities.values()), priorities=priorities, categories={})
+
+
+async def _rebuild_stats_counters(session: AsyncSession, tg_id: int) -> Statistics:
+    # пока новая строка счетчиков не закоммичена, чужие _update_stats_counters ее не видят,
+    # и дельта задачи, которой нет в подсчете, потерялась бы. На PostgreSQL поэтому сначала
+    # блокируем пользователя и его задачи: вставка задачи ждет строку users через внешний ключ,
+    # выполнение и удаление ждут свои строки tasks. На SQLite FOR UPDATE не нужен, а запросы
+    # без него только зря читали бы все задачи: вставка ниже и так открывает единственную
+    # пишущую транзакцию до подсчета
+    if session.get_bind().dialect.name == 'postgresql':
+        await session.execute(select(User.tg_id).where(User.tg_id == tg_id).with_for_update())
+        await session.execute(select(Task.id).where(Task.user_id == tg_id).with_for_update())
+    await session.execute(dialect_insert(session, UserStats).values(tg_id=tg_id).on_conflict_do_nothing())
+    stats = await _aggregate_statistics(session, tg_id)
+
+    await session.execute(
+        update(UserStats).where(UserStats.tg_id == tg_id).values(
+            total=stats['total'],
+            completed=stats['completed'],
+            **{column: stats['priorities'].get(priority, 0) for priority, column in PRIORITY_COUNTERS.items()}
         )
-        await session.commit()
+    )
+    await session.commit()
 
+    stats['categories'] = {}
+    return stats
 
-async def get_statistics(tg_id: int):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
 
-        result = await session.execute(
-            select(Task).where(Task.user_id == user.tg_id)
+async def _update_stats_counters(session: AsyncSession, tg_id: int, deltas: Dict[str, int]):
+    # если строки еще нет, она будет посчитана целиком при первом чтении
+    if not USE_STATS_COUNTERS:
+        return
+
+    await session.execute(
+        update(UserStats).where(UserStats.tg_id == tg_id).values(
+            **{column: getattr(UserStats, column) + delta for column, delta in deltas.items()}
         )
-        all_tasks = result.scalars().all()
+    )
 
-        total = len(all_tasks)
-        completed = sum(1 for task in all_tasks if task.is_completed)
-        active = total - completed
 
-        priorities = {1: 0, 2: 0, 3: 0}
-        for task in all_tasks:
-            if not task.is_completed:
-                priorities[task.priority] = priorities.get(task.priority, 0) + 1
+def _active_delta(priority: int, delta: int) -> Dict[str, int]:
+    column = PRIORITY_COUNTERS.get(priority)
+    return {column: delta} if column else {}
 
-        categories = {}
-        for task in all_tasks:
-            if task.category and not task.is_completed:
-                categories[task.category] = categories.get(task.category, 0) + 1
 
-        return {
-            'total': total,
-            'completed': completed,
-            'active': active,
-            'priorities': priorities,
-            'categories': categories
-        }
+class HistoryEntry(NamedTuple):
+    task_id: int
+    name: str
+    priority: int
+    category: Optional[str]
+    completed_at: Optional[datetime]
 
 
-async def get_user_categories(tg_id: int):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
+async def get_task_history(tg_id: int, limit: int = 20, session: AsyncSession = None) -> List[HistoryEntry]:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
+
+        # недавно выполненные еще в tasks, старые уже в архиве
+        done = union_all(
+            select(Task.id.label('task_id'), Task.name, Task.priority, Task.category_id, Task.completed_at)
+            .where(and_(Task.user_id == tg_id, Task.is_completed == True)),
+            select(TaskArchive.task_id, TaskArchive.name, TaskArchive.priority,
+                   TaskArchive.category_id, TaskArchive.completed_at)
+            .where(TaskArchive.user_id == tg_id)
+        ).subquery()
 
         result = await session.execute(
-            select(Task.category)
-            .where(
-                and_(
-                    Task.user_id == user.tg_id,
-                    Task.category.isnot(None)
+            select(done.c.task_id, done.c.name, done.c.priority, Category.name, done.c.completed_at)
+            .select_from(done)
+            .outerjoin(Category, done.c.category_id == Category.id)
+            .order_by(desc(done.c.completed_at).nulls_last(), desc(done.c.task_id))
+            .limit(limit)
+        )
+        return [HistoryEntry(*row) for row in result]
+
+
+ARCHIVE_CHUNK_SIZE = 500
+
+ARCHIVED_COLUMNS = ('task_id', 'user_id', 'name', 'description', 'category_id', 'priority',
+                    'deadline', 'created_at', 'completed_at')
+
+
+async def archive_completed_tasks(older_than: timedelta, chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                                  max_chunks: int = None, pause: float = 0.0,
+                                  session_pool: async_sessionmaker = async_session) -> int:
+    # каждая порция - отдельная короткая транзакция, между ними другие запросы успевают писать
+    # задачи, выполненные до появления completed_at, заполняет backfill_completed_at
+    cutoff = datetime.now() - older_than
+    moved = 0
+    chunks = 0
+
+    while max_chunks is None or chunks < max_chunks:
+        async with session_pool() as session:
+            task_ids = (await session.execute(
+                select(Task.id)
+                .where(and_(Task.is_completed == True, Task.completed_at < cutoff))
+                .order_by(Task.id)
+                .limit(chunk_size)
+            )).scalars().all()
+            if not task_ids:
+                break
+
+            await session.execute(
+                insert(TaskArchive).from_select(
+                    ARCHIVED_COLUMNS,
+                    select(Task.id, Task.user_id, Task.name, Task.description, Task.category_id,
+                           Task.priority, Task.deadline, Task.created_at, Task.completed_at)
+                    .where(Task.id.in_(task_ids))
                 )
             )
-            .distinct()
-        )
-        task_categories = result.scalars().all()
+            await session.execute(delete(TaskReminder).where(TaskReminder.task_id.in_(task_ids)))
+            await session.execute(delete(Task).where(Task.id.in_(task_ids)))
+            await session.commit()
+
+        moved += len(task_ids)
+        chunks += 1
+        if pause:
+            await asyncio.sleep(pause)
+
+    return moved
 
-        result2 = await session.execute(
-            select(Category.name).where(Category.tg_id == tg_id)
+
+async def get_user_categories(tg_id: int, session: AsyncSession = None):
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
+
+        result = await session.execute(
+            select(Category.name)
+            .where(and_(Category.tg_id == tg_id, Category.name.isnot(None)))
+            .order_by(Category.name)
         )
-        db_categories = result2.scalars().all()
+        return list(result.scalars().all())
 
-        all_categories = set(task_categories) | set(db_categories)
-        return [str(cat) for cat in all_categories if cat]
 
+async def get_category_task_counts(tg_id: int, session: AsyncSession = None) -> Dict[str, int]:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
 
-async def create_category(tg_id: int, name: str):
-    async with async_session() as session:
-        existing = await session.execute(
-            select(Category).where(
-                and_(Category.tg_id == tg_id, Category.name == name)
-            )
+        # категории пользователя идут по (tg_id, name), задачи к ним - по индексу на category_id
+        result = await session.execute(
+            select(Category.name, func.count(Task.id))
+            .select_from(Category)
+            .outerjoin(Task, and_(Task.category_id == Category.id, Task.is_completed == False))
+            .where(and_(Category.tg_id == tg_id, Category.name.isnot(None)))
+            .group_by(Category.id, Category.name)
+            .order_by(Category.name)
         )
-        if existing.scalar_one_or_none():
-            return None
+        return {str(name): count for name, count in result}
 
-        category = Category(tg_id=tg_id, name=name)
-        session.add(category)
+
+async def create_category(tg_id: int, name: str, session: AsyncSession = None):
+    async with session_scope(session) as session:
+        category = await session.scalar(
+            dialect_insert(session, Category).values(tg_id=tg_id, name=name)
+            .on_conflict_do_nothing(index_elements=[Category.tg_id, Category.name])
+            .returning(Category)
+        )
         await session.commit()
-        await session.refresh(category)
         return category
 
 
-async def get_tasks_by_category(tg_id: int, category_name: str):
-    async with async_session() as session:
-        user = await get_or_create_user(tg_id)
+async def get_tasks_by_category(tg_id: int, category_name: str, session: AsyncSession = None) -> List[TaskRow]:
+    async with read_scope(session) as session:
+        await ensure_user(session, tg_id)
 
         result = await session.execute(
-            select(Task).where(
+            _select_task_rows().where(
                 and_(
-                    Task.user_id == user.tg_id,
-                    Task.category == category_name,
+                    Task.user_id == tg_id,
+                    Category.tg_id == tg_id,
+                    Category.name == category_name,
                     Task.is_completed == False
                 )
             ).order_by(desc(Task.priority), asc(Task.created_at))
         )
-        return result.scalars().all()
\ No newline at end of file
+        return _task_rows(result)
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.models import Base, build_engine, setup_schema
+from database import requests
+
+# например: postgresql+asyncpg://postgres@localhost/postgres
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.fixture(scope="session")
+def postgres_url():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL не задан")
+
+    # на время тестов создается отдельная одноразовая база
+    server_url = make_url(TEST_POSTGRES_URL)
+    database = f"test_{uuid.uuid4().hex[:12]}"
+
+    async def execute(statement):
+        engine = build_engine(server_url.render_as_string(hide_password=False))
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.exec_driver_sql(statement)
+        await engine.dispose()
+
+    # фикстура может запрашиваться из уже работающего цикла событий
+    def run(statement):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(asyncio.run, execute(statement)).result()
+
+    run(f'CREATE DATABASE "{database}"')
+    yield server_url.set(database=database).render_as_string(hide_password=False)
+    run(f'DROP DATABASE "{database}" WITH (FORCE)')
+
+
+@pytest_asyncio.fixture(params=["sqlite", "postgresql"])
+async def engine(request, tmp_path):
+    if request.param == "sqlite":
+        url = f"sqlite+aiosqlite:///{tmp_path / 'test.sqlite3'}"
+    else:
+        url = request.getfixturevalue("postgres_url")
+
+    engine = build_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(setup_schema)
+    requests._known_users.clear()
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session(engine):
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        yield session
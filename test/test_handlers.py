@@ -3,9 +3,23 @@ from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch
 from datetime import datetime
 
+from database.requests import HistoryEntry, TaskPage, _bump_data_version, create_task
+
 from bot.handlers import (cmd_start, cmd_help, format_tasks_list,mark_task_done,
     delete_task_handler, main_menu_button, list_tasks, process_category_name,
-    tasks_on_today, stats_inline, back_in_task_handler, CreateTask)
+    tasks_on_today, stats_inline, back_in_task_handler, show_categories_handler, CreateTask,
+    fit_tasks_page, text_length, parse_task_positions, find_tasks_handler, task_history_handler,
+    add_name, render_tasks_page, render_today, render_stats, render_search_page,
+    task_on_week_inline, format_deadline_tasks,
+    TASKS_HEADER, TASKS_FOOTER)
+from bot.keyboards import TasksPage, FindPage
+from bot.render_cache import render_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_render_cache():
+    # в тестах данные подменяются моками без смены версии, поэтому кэш экранов сбрасываем
+    render_cache.clear()
 
 @pytest.fixture
 def test_message():
@@ -51,37 +65,89 @@ def test_format_tasks_list_single_task(test_task):
     assert "Высокий" in result
     assert "Ваши задачи" in result
 
+async def show_list(message, tasks):
+    with patch("bot.handlers.get_tasks_page", return_value=TaskPage(tasks, False)):
+        await list_tasks(message)
+    message.answer.reset_mock()
+
+
 @pytest.mark.asyncio
 async def test_mark_task_done_success(test_message, test_task):
-
+    await show_list(test_message, [test_task])
     test_message.text = "/done 1"
 
-    with patch("bot.handlers.get_user_tasks", return_value=[test_task]), \
-         patch("bot.handlers.complete_task", new_callable=AsyncMock):
+    with patch("bot.handlers.complete_tasks", return_value={test_task.id: test_task.name}) as complete:
 
         await mark_task_done(test_message)
 
+        complete.assert_awaited_once_with(12345, [test_task.id], session=None)
         test_message.answer.assert_called_once()
         assert "отмечена как выполненная" in test_message.answer.call_args.args[0]
 
 
 @pytest.mark.asyncio
 async def test_mark_task_done_invalid_id(test_message):
+    await show_list(test_message, [])
     test_message.text = "/done 999"
 
-    with patch("bot.handlers.get_user_tasks", return_value=[]):
+    await mark_task_done(test_message)
+
+    test_message.answer.assert_called_once()
+    assert "Неверный ID" in test_message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_mark_task_done_stale_list(test_message, test_task):
+    await show_list(test_message, [test_task])
+    _bump_data_version(test_message.from_user.id)
+    test_message.text = "/done 1"
+
+    with patch("bot.handlers.complete_tasks") as complete:
         await mark_task_done(test_message)
 
+        complete.assert_not_called()
+        assert "Список задач изменился" in test_message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_mark_task_done_bulk_reports_each_item(test_message, test_task):
+    tasks = [SimpleNamespace(**{**vars(test_task), "id": 10 + index, "name": f"Задача {index}"})
+             for index in range(1, 5)]
+    await show_list(test_message, tasks)
+    test_message.text = "/done 1 3-4 7"
+
+    with patch("bot.handlers.complete_tasks", return_value={11: "Задача 1", 14: "Задача 4"}) as complete:
+        await mark_task_done(test_message)
+
+        complete.assert_awaited_once_with(12345, [11, 13, 14], session=None)
         test_message.answer.assert_called_once()
-        assert "Неверный ID" in test_message.answer.call_args.args[0]
+        text = test_message.answer.call_args.args[0]
+        assert "2 из 4" in text
+        assert "1. ✅ Задача 1" in text
+        assert "3. ❌ уже выполнена или удалена" in text
+        assert "7. ❌ неверный ID" in text
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["1", "3", "5-7"], [1, 3, 5, 6, 7]),
+    (["2,4", "2"], [2, 4]),
+])
+def test_parse_task_positions(args, expected):
+    assert parse_task_positions(args) == expected
+
+
+@pytest.mark.parametrize("args", [[], ["x"], ["5-2"], ["-1"], ["1-1000"]])
+def test_parse_task_positions_rejects(args):
+    with pytest.raises(ValueError):
+        parse_task_positions(args)
 
 
 @pytest.mark.asyncio
 async def test_delete_task_success(test_message, test_task):
+    await show_list(test_message, [test_task])
     test_message.text = "/delete 1"
 
-    with patch("bot.handlers.get_user_tasks", return_value=[test_task]), \
-         patch("bot.handlers.delete_task", new_callable=AsyncMock):
+    with patch("bot.handlers.delete_tasks", return_value={test_task.id: test_task.name}):
 
         await delete_task_handler(test_message)
 
@@ -90,13 +156,13 @@ async def test_delete_task_success(test_message, test_task):
 
 @pytest.mark.asyncio
 async def test_delete_wrong_id(test_message):
+    await show_list(test_message, [])
     test_message.text = "/delete 5"
 
-    with patch("bot.handlers.get_user_tasks", return_value=[]):
-        await delete_task_handler(test_message)
+    await delete_task_handler(test_message)
 
-        test_message.answer.assert_called_once()
-        assert "Неверный ID задачи" in test_message.answer.call_args.args[0]
+    test_message.answer.assert_called_once()
+    assert "Неверный ID задачи" in test_message.answer.call_args.args[0]
 
 @pytest.mark.asyncio
 async def test_delete_task_invalid_format(test_message):
@@ -134,7 +200,7 @@ async def test_main_menu_button(test_message):
 @pytest.mark.asyncio
 async def test_list_tasks_empty(test_message):
 
-    with patch("bot.handlers.get_user_tasks", return_value=[]):
+    with patch("bot.handlers.get_tasks_page", return_value=TaskPage([], False)):
         await list_tasks(test_message)
 
         test_message.answer.assert_called_once()
@@ -201,3 +267,165 @@ async def test_category_already_exists(test_message):
         test_message.answer.assert_called_once()
         assert "уже существует" in test_message.answer.call_args.args[0]
 
+
+@pytest.mark.asyncio
+async def test_show_categories_renders_counts():
+
+    test_callback = AsyncMock()
+    test_callback.from_user.id = 123
+
+    with patch("bot.handlers.get_category_task_counts", return_value={"Дом": 0, "Учёба": 2}):
+        await show_categories_handler(test_callback)
+
+        test_callback.message.answer.assert_called_once()
+        assert "• Учёба (2 задач)" in test_callback.message.answer.call_args.args[0]
+        assert "• Дом (0 задач)" in test_callback.message.answer.call_args.args[0]
+
+
+def test_fit_tasks_page_respects_message_limit(test_task):
+    tasks = [SimpleNamespace(**{**vars(test_task), "id": index, "description": "д" * 900})
+             for index in range(1, 11)]
+
+    shown = fit_tasks_page(tasks, start=1)
+    text = "".join([TASKS_HEADER, *(block for _, _, block in shown), TASKS_FOOTER])
+
+    assert 0 < len(shown) < len(tasks)
+    assert text_length(text) <= 4096
+    assert [position for position, _, _ in shown] == list(range(1, len(shown) + 1))
+
+
+def test_fit_tasks_page_truncates_long_names(test_task):
+    # старая задача из SQLite с названием длиннее колонки
+    task = SimpleNamespace(**{**vars(test_task), "name": "н" * 5000, "description": "д" * 5000})
+
+    [(_, _, block)] = fit_tasks_page([task], start=1)
+
+    assert "н" * 200 + "…" in block and "н" * 201 not in block
+    assert text_length(TASKS_HEADER + block + TASKS_FOOTER) <= 4096
+
+
+@pytest.mark.asyncio
+async def test_week_tasks_fit_message_limit(test_task):
+    tasks = [SimpleNamespace(**{**vars(test_task), "id": index, "description": "д" * 5000})
+             for index in range(1, 11)]
+    tasks.append(SimpleNamespace(**{**vars(test_task), "id": 11, "description": None}))
+    callback = AsyncMock()
+    callback.from_user.id = 123
+
+    with patch("bot.handlers.get_tasks_for_week", return_value=tasks):
+        await task_on_week_inline(callback)
+
+    message = callback.message.answer.call_args.args[0]
+    assert text_length(message) <= 4096
+    assert "д" * 1000 + "…" in message and "д" * 1001 not in message
+    shown = message.count("────────────────────")
+    assert 0 < shown < len(tasks)
+    assert f"…и еще задач: {len(tasks) - shown}" in message
+
+
+def test_deadline_tasks_without_description(test_task):
+    task = SimpleNamespace(**{**vars(test_task), "description": None})
+
+    text = format_deadline_tasks([task], "📅 Задачи на сегодня:")
+
+    assert "None" not in text and "Без описания" in text
+    assert "не поместились" not in text
+
+
+@pytest.mark.asyncio
+async def test_add_name_rejects_too_long_name(test_message):
+    state = AsyncMock()
+    test_message.text = "н" * 201
+
+    await add_name(test_message, state)
+
+    assert "слишком длинное" in test_message.answer.call_args.args[0]
+    state.update_data.assert_not_called()
+    state.set_state.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_shows_next_page_button(test_message, test_task):
+    with patch("bot.handlers.get_tasks_page", return_value=TaskPage([test_task], True)):
+        await list_tasks(test_message)
+
+    keyboard = test_message.answer.call_args.kwargs["reply_markup"]
+    buttons = keyboard.inline_keyboard[0]
+    assert [button.text for button in buttons] == ["▶️"]
+    assert TasksPage.unpack(buttons[0].callback_data).position == 2
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_served_from_cache_until_data_changes(test_message, test_task):
+    with patch("bot.handlers.get_tasks_page", return_value=TaskPage([test_task], False)) as page:
+        await list_tasks(test_message)
+        await list_tasks(test_message)
+        assert page.await_count == 1
+        assert render_cache.metrics.hits == 1
+
+        _bump_data_version(test_message.from_user.id)
+        await list_tasks(test_message)
+        assert page.await_count == 2
+
+    assert test_message.answer.call_args_list[0] == test_message.answer.call_args_list[1]
+
+
+@pytest.mark.asyncio
+async def test_today_cache_expires_at_midnight(test_message, test_task):
+    with patch("bot.handlers.get_tasks_for_today", return_value=[]) as today, \
+            patch("bot.handlers.datetime") as clock:
+        clock.now.return_value = datetime(2025, 1, 1, 23, 59)
+        await tasks_on_today(test_message)
+        await tasks_on_today(test_message)
+        assert today.await_count == 1
+
+        clock.now.return_value = datetime(2025, 1, 2, 0, 0)
+        await tasks_on_today(test_message)
+        assert today.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_find_tasks_lists_matches_with_next_page(test_message, test_task):
+    test_message.text = "/find курсовая"
+    found = SimpleNamespace(**vars(test_task), is_completed=False)
+
+    with patch("bot.handlers.search_tasks", return_value=TaskPage([found], True)) as search:
+        await find_tasks_handler(test_message)
+
+        search.assert_awaited_once_with(12345, "курсовая", offset=0, page_size=10, session=None)
+    text = test_message.answer.call_args.args[0]
+    assert "1. 🔴 Сдать курсовую" in text
+    buttons = test_message.answer.call_args.kwargs["reply_markup"].inline_keyboard[0]
+    assert FindPage.unpack(buttons[0].callback_data).offset == 10
+
+
+@pytest.mark.asyncio
+async def test_find_tasks_requires_query(test_message):
+    test_message.text = "/find"
+
+    await find_tasks_handler(test_message)
+
+    assert "Использование" in test_message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_history_lists_completed_tasks(test_message):
+    test_message.text = "/history"
+    history = [HistoryEntry(1, "Сдать курсовую", 3, "Учёба", datetime(2025, 1, 1, 12, 0))]
+
+    with patch("bot.handlers.get_task_history", return_value=history):
+        await task_history_handler(test_message)
+
+    assert "🔴 Сдать курсовую — 01.01.2025 🏷️ Учёба" in test_message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_render_helpers_return_connection_before_reply(engine, session):
+    # общая сессия апдейта не должна держать соединение, пока ответ ждет отправки в Telegram
+    await create_task(12345, "Сдать курсовую", deadline=datetime.now(), session=session)
+
+    for render in (render_tasks_page, render_today, render_stats):
+        assert await render(12345, session=session) is not None
+        assert engine.pool.checkedout() == 0
+    await render_search_page(12345, "курс", session=session)
+    assert engine.pool.checkedout() == 0
@@ -0,0 +1,71 @@
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from bot.inline import InlineTask, InlineTaskLookup, TaskPrefixIndex, inline_tasks_handler
+from database.requests import _bump_data_version
+
+
+def make_tasks(*names):
+    return [InlineTask(index, name, None, None, 2, None) for index, name in enumerate(names, 1)]
+
+
+def test_prefix_index_matches_word_prefixes():
+    index = TaskPrefixIndex(1, make_tasks("Сдать курсовую", "Курс английского", "Купить хлеб"))
+
+    assert [task.id for task in index.search("кур")] == [1, 2]
+    assert [task.id for task in index.search("КУ")] == [1, 2, 3]
+    assert [task.id for task in index.search("курс англ")] == [2]
+    assert index.search("молоко") == []
+    assert [task.id for task in index.search("  ", limit=2)] == [1, 2]
+
+
+@pytest.fixture
+def lookup():
+    with patch("bot.inline.lookup", InlineTaskLookup()) as lookup:
+        yield lookup
+
+
+def make_query(query_id, query):
+    inline_query = AsyncMock()
+    inline_query.id = query_id
+    inline_query.query = query
+    inline_query.from_user.id = 777
+    return inline_query
+
+
+@pytest.mark.asyncio
+async def test_inline_query_reuses_index_between_keystrokes(lookup):
+    tasks = [SimpleNamespace(id=1, name="Сдать курсовую", description="по физике", category="Учёба",
+                             priority=3, deadline=datetime(2025, 1, 1, 12, 0))]
+
+    with patch("bot.inline.get_user_tasks", return_value=tasks) as get_tasks:
+        for query_id, query in enumerate(["к", "ку", "кур"]):
+            inline_query = make_query(str(query_id), query)
+            await inline_tasks_handler(inline_query)
+        assert get_tasks.await_count == 1
+
+        _bump_data_version(777)
+        await inline_tasks_handler(make_query("4", "кур"))
+        assert get_tasks.await_count == 2
+
+    results = inline_query.answer.call_args.args[0]
+    assert [result.id for result in results] == ["1"]
+    assert "01.01.2025 12:00" in results[0].input_message_content.message_text
+    assert inline_query.answer.call_args.kwargs["is_personal"] is True
+
+
+@pytest.mark.asyncio
+async def test_superseded_inline_query_is_not_answered(lookup):
+    first, second = make_query("1", "к"), make_query("2", "ку")
+
+    async def typed_further(*args, **kwargs):
+        lookup.mark_latest(777, second.id)
+        return []
+
+    with patch("bot.inline.get_user_tasks", side_effect=typed_further):
+        await inline_tasks_handler(first)
+
+    first.answer.assert_not_called()
@@ -0,0 +1,21 @@
+import pytest
+
+from bench.loadtest import percentile, run_load_test
+
+
+def test_percentile_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+
+
+@pytest.mark.asyncio
+async def test_load_test_walks_scenario_against_fake_api(tmp_path):
+    report = await run_load_test(users=3, iterations=1, db_path=str(tmp_path / "load.sqlite3"))
+
+    assert report["updates"] == 3 * 9
+    assert report["handlers"]["save_task_handler"]["count"] == 3
+    assert report["handlers"]["save_task_handler"]["queries"] > 0
+    assert report["api_calls"]["sendMessage"] >= report["updates"]
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+import pytest
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Message, Update
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import text
+
+from bot.metrics import Histogram, MetricsMiddleware, MetricsRegistry, MetricsServer, callback_label
+from database.models import track_queries
+
+USER = {"id": 10, "is_bot": False, "first_name": "Тест"}
+MESSAGE = {
+    "message_id": 7,
+    "date": 1700000000,
+    "chat": {"id": 10, "type": "private"},
+    "from": USER,
+    "text": "Список задач"
+}
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Задержка", (0.1, 1.0), ("handler",))
+    histogram.observe(0.05, handler="list_tasks")
+    histogram.observe(0.1, handler="list_tasks")
+    histogram.observe(3, handler="list_tasks")
+
+    assert histogram.render() == [
+        "# HELP latency_seconds Задержка",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{handler="list_tasks",le="0.1"} 2',
+        'latency_seconds_bucket{handler="list_tasks",le="1.0"} 2',
+        'latency_seconds_bucket{handler="list_tasks",le="+Inf"} 3',
+        'latency_seconds_sum{handler="list_tasks"} 3.15',
+        'latency_seconds_count{handler="list_tasks"} 3',
+    ]
+
+
+def test_callback_label_keeps_prefix():
+    assert callback_label("tp:n:3:1") == "tp"
+    assert callback_label("priority_high") == "priority_high"
+    assert callback_label(None) == ""
+    assert len(callback_label("x" * 100)) == 32
+
+
+@pytest.mark.asyncio
+async def test_track_queries_counts_statements(session):
+    await session.execute(text("SELECT 1"))
+
+    with track_queries() as queries:
+        await session.execute(text("SELECT 1"))
+        await session.execute(text("SELECT 2"))
+
+    await session.execute(text("SELECT 3"))
+    assert queries.statements == 2
+    assert queries.seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_labels_updates_by_handler(session, caplog):
+    router = Router()
+
+    @router.message(F.text == "Список задач")
+    async def list_tasks(message: Message):
+        await session.execute(text("SELECT 1"))
+
+    @router.callback_query()
+    async def slow_callback(callback: CallbackQuery):
+        await asyncio.sleep(0.02)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    registry = MetricsRegistry()
+    MetricsMiddleware(registry, slow_threshold=0.01).setup(dp)
+    bot = Bot(token="42:TEST")
+
+    await dp.feed_update(bot, Update.model_validate({"update_id": 1, "message": MESSAGE}))
+    await dp.feed_update(bot, Update.model_validate({"update_id": 2, "message": {**MESSAGE, "text": "?"}}))
+    with caplog.at_level(logging.WARNING, logger="bot.metrics"):
+        await dp.feed_update(bot, Update.model_validate({"update_id": 3, "callback_query": {
+            "id": "1", "from": USER, "chat_instance": "10", "data": "tp:n:3:1"}}))
+
+    output = registry.render()
+    assert 'bot_update_duration_seconds_count{handler="list_tasks",callback=""} 1' in output
+    assert 'bot_update_duration_seconds_count{handler="unhandled",callback=""} 1' in output
+    assert 'bot_update_duration_seconds_count{handler="slow_callback",callback="tp"} 1' in output
+    assert 'bot_update_db_statements_sum{handler="list_tasks"} 1' in output
+    assert any("slow_callback [tp]" in record.getMessage() for record in caplog.records)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_registry():
+    registry = MetricsRegistry()
+    registry.update_statements.observe(4, handler="stats_inline")
+    server = MetricsServer(registry)
+
+    async with TestClient(TestServer(server.make_app())) as client:
+        response = await client.get("/metrics")
+        assert response.status == 200
+        body = await response.text()
+
+    assert 'bot_update_db_statements_bucket{handler="stats_inline",le="5.0"} 1' in body
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.migrations import backfill_completed_at, backfill_task_categories
+from database.models import Task, describe_engine, setup_schema
+from database.requests import (archive_completed_tasks, create_task, get_category_task_counts, mark_reminder_sent,
+                               search_tasks)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pragmas_applied_on_connect(engine):
+    if engine.dialect.name != "sqlite":
+        pytest.skip("PRAGMA есть только в SQLite")
+
+    settings = await describe_engine(engine)
+
+    assert settings["journal_mode"] == "wal"
+    assert settings["synchronous"] == 1
+    assert settings["busy_timeout"] == 5000
+    assert settings["temp_store"] == 2
+    assert "Pool size: 5" in settings["pool"]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_enforces_foreign_key_actions(engine):
+    if engine.dialect.name != "sqlite":
+        pytest.skip("PostgreSQL проверяет внешние ключи всегда")
+
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_pool() as session:
+        task = await create_task(1, "Задача", category="Дом", session=session)
+        reminded = await create_task(1, "С напоминанием", session=session)
+        await mark_reminder_sent(reminded.id, session=session)
+
+    async with engine.begin() as conn:
+        assert (await conn.exec_driver_sql("PRAGMA foreign_keys")).scalar() == 1
+        await conn.exec_driver_sql(f"DELETE FROM tasks WHERE id = {reminded.id}")
+        await conn.exec_driver_sql("DELETE FROM categories")
+
+    async with engine.connect() as conn:
+        # ON DELETE CASCADE у напоминаний и ON DELETE SET NULL у категории задачи
+        assert (await conn.exec_driver_sql("SELECT count(*) FROM task_reminders")).scalar() == 0
+        assert (await conn.exec_driver_sql(
+            f"SELECT category_id FROM tasks WHERE id = {task.id}")).scalar() is None
+
+
+@pytest.mark.asyncio
+async def test_category_backfill_migrates_legacy_rows(engine):
+    # приводим базу к виду до появления category_id
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("DROP INDEX ix_categories_user_name")
+        if engine.dialect.name == "sqlite":
+            await conn.exec_driver_sql("DROP TABLE tasks")
+            await conn.exec_driver_sql(
+                "CREATE TABLE tasks (id INTEGER PRIMARY KEY, user_id BIGINT, name VARCHAR(200) NOT NULL, "
+                "description TEXT, category VARCHAR(100), priority INTEGER, deadline DATETIME, "
+                "created_at DATETIME, is_completed BOOLEAN, completed_at DATETIME)"
+            )
+        else:
+            await conn.exec_driver_sql("ALTER TABLE tasks DROP COLUMN category_id")
+        await conn.exec_driver_sql("INSERT INTO users (tg_id) VALUES (1), (2)")
+        await conn.exec_driver_sql("INSERT INTO categories (tg_id, name) VALUES (1, 'Дом'), (1, 'Дом')")
+        for index, (user_id, category) in enumerate([(1, "Дом"), (1, "Работа"), (1, None), (2, "Дом"),
+                                                     (1, "Работа"), (1, "Дом")]):
+            await conn.exec_driver_sql(
+                "INSERT INTO tasks (user_id, name, category, priority, is_completed) "
+                f"VALUES ({user_id}, 'Задача {index}', {repr(category) if category else 'NULL'}, 2, false)"
+            )
+
+    async with engine.begin() as conn:
+        await conn.run_sync(setup_schema)
+
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    assert await backfill_task_categories(session_pool, chunk_size=2) == 5
+    assert await backfill_task_categories(session_pool, chunk_size=2) == 0
+
+    async with session_pool() as session:
+        tasks = (await session.execute(select(Task).order_by(Task.id))).scalars().all()
+        assert [task.category for task in tasks] == ["Дом", "Работа", None, "Дом", "Работа", "Дом"]
+        assert all(task.legacy_category is None for task in tasks)
+        assert tasks[0].category_id == tasks[5].category_id != tasks[3].category_id
+        assert await get_category_task_counts(1, session=session) == {"Дом": 2, "Работа": 2}
+
+
+@pytest.mark.asyncio
+async def test_completed_at_backfill_lets_archiver_use_index(engine):
+    old = datetime.now() - timedelta(days=40)
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("INSERT INTO users (tg_id) VALUES (1)")
+        # выполнены до появления completed_at
+        for index in range(3):
+            await conn.exec_driver_sql(
+                "INSERT INTO tasks (user_id, name, priority, is_completed, created_at) "
+                f"VALUES (1, 'Старая {index}', 2, true, '{old:%Y-%m-%d %H:%M:%S}')"
+            )
+        await conn.exec_driver_sql(
+            "INSERT INTO tasks (user_id, name, priority, is_completed) VALUES (1, 'Активная', 2, false)"
+        )
+
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    assert await archive_completed_tasks(timedelta(days=30), session_pool=session_pool) == 0
+    assert await backfill_completed_at(session_pool, chunk_size=2) == 3
+    assert await backfill_completed_at(session_pool, chunk_size=2) == 0
+    assert await archive_completed_tasks(timedelta(days=30), session_pool=session_pool) == 3
+
+    if engine.dialect.name == "sqlite":
+        async with engine.connect() as conn:
+            plan = await conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM tasks WHERE is_completed = 1 AND completed_at < '2025-01-01'"
+            ))
+            assert "ix_tasks_completed_at" in " ".join(row[-1] for row in plan)
+
+
+@pytest.mark.asyncio
+async def test_search_index_without_user_id_is_recreated(engine):
+    if engine.dialect.name != "sqlite":
+        pytest.skip("FTS5-таблица есть только в SQLite")
+
+    # индекс в том виде, в каком его создавали до появления user_id
+    async with engine.begin() as conn:
+        for trigger in ("tasks_fts_insert", "tasks_fts_delete", "tasks_fts_update"):
+            await conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        await conn.exec_driver_sql("DROP TABLE tasks_fts")
+        await conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE tasks_fts USING fts5(name, description, content='tasks', content_rowid='id')")
+        await conn.exec_driver_sql("INSERT INTO users (tg_id) VALUES (1)")
+        await conn.exec_driver_sql("INSERT INTO tasks (user_id, name, priority, is_completed) "
+                                   "VALUES (1, 'Сдать курсовую', 2, false)")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(setup_schema)
+        columns = [row[1] for row in await conn.exec_driver_sql("PRAGMA table_info(tasks_fts)")]
+    assert columns == ["name", "description", "user_id"]
+
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        await create_task(1, "Курсовая: литература", session=session)
+        found = await search_tasks(1, "курсов", session=session)
+        assert {task.name for task in found.tasks} == {"Сдать курсовую", "Курсовая: литература"}
+        assert (await search_tasks(2, "курсов", session=session)).tasks == []
@@ -0,0 +1,56 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.outbound import BULK, INTERACTIVE, OutboundScheduler, ThrottledSession
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_goes_before_bulk():
+    scheduler = OutboundScheduler(global_rate=20, chat_burst=10)
+    await scheduler.acquire(None)
+    scheduler.global_bucket.tokens = 0
+
+    order = []
+
+    async def send(name, lane):
+        await scheduler.acquire(None, lane)
+        order.append(name)
+
+    bulk = [asyncio.create_task(send(f"bulk {index}", BULK)) for index in range(2)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(send("reply", INTERACTIVE))
+    await asyncio.gather(*bulk, interactive)
+
+    assert order == ["reply", "bulk 0", "bulk 1"]
+    assert scheduler.metrics.lanes[BULK].sent == 2
+    assert scheduler.metrics.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_bucket_limits_burst():
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=2)
+
+    started = asyncio.get_running_loop().time()
+    for _ in range(4):
+        await scheduler.acquire(1)
+
+    assert asyncio.get_running_loop().time() - started >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honored():
+    method = SendMessage(chat_id=1, text="Привет")
+    session = ThrottledSession(OutboundScheduler(chat_rate=100), max_retries=2)
+    send = AsyncMock(side_effect=[TelegramRetryAfter(method, "Too Many Requests", 0), "ok"])
+
+    with patch.object(AiohttpSession, "make_request", send):
+        assert await session.make_request(Bot(token="42:TEST"), method) == "ok"
+
+    assert send.await_count == 2
+    assert session.scheduler.metrics.retries == 1
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.reminders import ReminderScheduler
+from database.requests import complete_task, create_task, delete_task
+
+
+@pytest_asyncio.fixture
+async def scheduler(engine):
+    bot = AsyncMock()
+    scheduler = ReminderScheduler(bot, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+                                  advance=timedelta(0))
+    yield scheduler
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_reload_loads_only_window_and_catches_up(scheduler, session):
+    now = datetime.now()
+    missed = await create_task(1, "Пропущенная", deadline=now - timedelta(hours=1), session=session)
+    await create_task(1, "Давняя", deadline=now - timedelta(days=3), session=session)
+    await create_task(1, "Далекая", deadline=now + timedelta(days=3), session=session)
+    soon = await create_task(1, "Скоро", deadline=now + timedelta(hours=1), session=session)
+
+    await scheduler.reload()
+
+    due = scheduler.pop_due(now)
+    assert [item.task_id for item in due] == [missed.id]
+    assert scheduler.next_due() == soon.deadline
+
+    due += scheduler.pop_due(now + timedelta(hours=2))
+    for item in due:
+        await scheduler.send(item)
+    assert scheduler.bot.send_message.await_count == 2
+
+    await scheduler.reload()
+    assert scheduler.next_due() is None
+
+
+@pytest.mark.asyncio
+async def test_heap_follows_task_mutations(scheduler, session):
+    await scheduler.start()
+    await scheduler.reload()
+    now = datetime.now()
+
+    first = await create_task(1, "Первая", deadline=now + timedelta(minutes=5), session=session)
+    second = await create_task(1, "Вторая", deadline=now + timedelta(minutes=10), session=session)
+    await create_task(1, "Без срока", session=session)
+    assert scheduler.next_due() == first.deadline
+
+    await complete_task(1, first.id, session=session)
+    assert scheduler.next_due() == second.deadline
+
+    await delete_task(1, second.id, session=session)
+    assert scheduler.next_due() is None
+
+
+@pytest.mark.asyncio
+async def test_created_event_skips_deadlines_older_than_catch_up(scheduler, session):
+    await scheduler.start()
+    await scheduler.reload()
+    now = datetime.now()
+
+    await create_task(1, "Давняя", deadline=now - timedelta(days=3), session=session)
+    assert scheduler.next_due() is None
+
+    recent = await create_task(1, "Недавняя", deadline=now - timedelta(hours=1), session=session)
+    assert scheduler.next_due() == recent.deadline
+
+
+@pytest.mark.asyncio
+async def test_failed_send_is_retried_and_not_marked_sent(scheduler, session):
+    scheduler.max_attempts = 2
+    scheduler.bot.send_message.side_effect = RuntimeError("сеть недоступна")
+    await create_task(1, "Задача", deadline=datetime.now() - timedelta(minutes=1), session=session)
+    await scheduler.reload()
+
+    [item] = scheduler.pop_due(datetime.now())
+    await scheduler.send(item)
+    # попытка не удалась: напоминание осталось в куче с отсрочкой, а reload его не теряет
+    retry_at = scheduler.next_due()
+    assert retry_at > datetime.now()
+    await scheduler.reload()
+    assert scheduler.next_due() == retry_at
+
+    # вторая неудача исчерпывает попытки: задача помечается, чтобы не повторять бесконечно
+    [item] = scheduler.pop_due(retry_at)
+    await scheduler.send(item)
+    await scheduler.reload()
+    assert scheduler.next_due() is None
+    assert scheduler.bot.send_message.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_successful_retry_marks_sent(scheduler, session):
+    scheduler.bot.send_message.side_effect = [RuntimeError("сеть недоступна"), None]
+    await create_task(1, "Задача", deadline=datetime.now() - timedelta(minutes=1), session=session)
+    await scheduler.reload()
+
+    [item] = scheduler.pop_due(datetime.now())
+    await scheduler.send(item)
+    [item] = scheduler.pop_due(scheduler.next_due())
+    await scheduler.send(item)
+
+    await scheduler.reload()
+    assert scheduler.next_due() is None
+    assert not scheduler._retries
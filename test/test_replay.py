@@ -0,0 +1,108 @@
+import json
+import sqlite3
+
+import pytest
+from aiogram.types import Update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bench.replay import REPLAY_BOT_ID, StubSession, anonymize_database, replay
+from bot.recorder import IdAnonymizer, UpdateRecorder, read_records, record_files
+from bot.render_cache import render_cache
+from database.models import build_engine, setup_schema
+from database.requests import create_task
+
+USER = {"id": 555, "is_bot": False, "first_name": "Иван", "username": "ivan"}
+
+
+def make_update(update_id, text=None, data=None):
+    if data is not None:
+        return Update.model_validate({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": USER, "chat_instance": "-123", "data": data,
+            "message": {"message_id": 1, "date": 1700000000, "text": "...",
+                        "chat": {"id": 555, "type": "private", "first_name": "Иван"}}}})
+    return Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 1700000000, "text": text, "from": USER,
+        "chat": {"id": 555, "type": "private", "first_name": "Иван", "username": "ivan"}}})
+
+
+def test_recorder_anonymizes_users_and_rotates(tmp_path):
+    recorder = UpdateRecorder(tmp_path, max_bytes=600, backup_count=10, salt="secret")
+    for update_id in range(1, 7):
+        recorder.record(make_update(update_id, text=f"Задача {update_id}"), timestamp=1700000000 + update_id)
+    recorder.close()
+
+    files = record_files(tmp_path)
+    assert len(files) > 1
+    assert files[-1].name == "updates.ndjson"
+
+    records = list(read_records([tmp_path]))
+    assert [record["u"]["update_id"] for record in records] == [1, 2, 3, 4, 5, 6]
+    message = records[0]["u"]["message"]
+    assert message["from"]["id"] == message["chat"]["id"] != 555
+    assert message["text"] == "Задача 1"
+    assert "Иван" not in json.dumps(records, ensure_ascii=False)
+    assert "ivan" not in json.dumps(records)
+    # одна и та же соль дает те же id между перезапусками
+    assert UpdateRecorder(tmp_path / "other", salt="secret").anonymizer.anonymize_id(555) == message["from"]["id"]
+
+
+@pytest.mark.asyncio
+async def test_replay_runs_recorded_scenario(tmp_path):
+    recorder = UpdateRecorder(tmp_path / "log", salt="secret")
+    scenario = [("Добавить задачу", None), ("Купить хлеб", None), ("без описания", None),
+                (None, "skip_category"), (None, "priority_high"), (None, "skip_deadline"),
+                (None, "save_task"), ("Список задач", None)]
+    for update_id, (text, data) in enumerate(scenario, start=1):
+        recorder.record(make_update(update_id, text=text, data=data), timestamp=1700000000 + update_id * 0.01)
+    recorder.close()
+
+    report = await replay([tmp_path / "log"], speed=2.0)
+
+    assert report["updates"] == len(scenario)
+    assert report["duration"] >= 0.03
+    assert report["handlers"]["save_task_handler"]["count"] == 1
+    assert report["handlers"]["save_task_handler"]["queries_per_update"] > 0
+    assert report["api_calls"]["sendMessage"] >= 6
+
+
+@pytest.mark.asyncio
+async def test_replay_on_database_copy_sees_recorded_users_tasks(tmp_path):
+    # кэш экранов общий для процесса, а псевдоним пользователя тот же, что в прошлом тесте
+    render_cache.clear()
+    db_path = tmp_path / "db.sqlite3"
+    engine = build_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(setup_schema)
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        await create_task(555, "Полить цветы", session=session)
+        await create_task(556, "Чужая задача", session=session)
+    await engine.dispose()
+
+    recorder = UpdateRecorder(tmp_path / "log", salt="secret")
+    recorder.record(make_update(1, text="Список задач"), timestamp=1700000000)
+    recorder.close()
+
+    api = StubSession()
+    report = await replay([tmp_path / "log"], db_path=db_path, salt="secret", session=api)
+
+    assert report["handlers"]["list_tasks"]["count"] == 1
+    [listing] = [text for text in api.texts if "Ваши задачи" in text]
+    assert "Полить цветы" in listing and "Чужая задача" not in listing
+
+    with pytest.raises(ValueError):
+        await replay([tmp_path / "log"], db_path=db_path, salt=None)
+
+
+def test_anonymize_database_rewrites_fsm_keys(tmp_path):
+    db_path = tmp_path / "db.sqlite3"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE fsm_states (key VARCHAR(200) PRIMARY KEY, state VARCHAR(100))")
+        conn.execute("INSERT INTO fsm_states VALUES ('777:555:555::default', 'CreateTask:name')")
+
+    anonymizer = IdAnonymizer("secret")
+    anonymize_database(db_path, anonymizer)
+
+    user_id = anonymizer.anonymize_id(555)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT key FROM fsm_states").fetchall() == [
+            (f"{REPLAY_BOT_ID}:{user_id}:{user_id}::default",)]
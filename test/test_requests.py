@@ -0,0 +1,366 @@
+import asyncio
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import requests
+from database.models import Task, TaskArchive, User, rebuild_search_index
+from database.requests import (create_task, get_user_tasks, get_tasks_in_range, complete_task,
+                               delete_task, complete_tasks, delete_tasks, get_statistics, create_category,
+                               get_category_task_counts, get_data_version, get_tasks_page,
+                               task_key, enable_write_batching, disable_write_batching,
+                               search_tasks, archive_completed_tasks, get_task_history, get_tasks_by_category,
+                               TaskRow, _known_users)
+
+
+@pytest.mark.asyncio
+async def test_user_created_once_and_cached(session):
+    await create_task(1, "Первая", session=session)
+    await create_task(1, "Вторая", session=session)
+
+    assert await session.scalar(select(func.count(User.id))) == 1
+    assert 1 in _known_users
+
+
+@pytest.mark.asyncio
+async def test_known_user_skips_lookup(engine, session):
+    await create_task(1, "Задача", session=session)
+
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    tasks = await get_user_tasks(1, session=session)
+
+    assert [task.name for task in tasks] == ["Задача"]
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_tasks_in_range_is_half_open(session):
+    day = datetime(2025, 3, 10)
+    await create_task(1, "Вчера", deadline=day - timedelta(seconds=1), session=session)
+    await create_task(1, "Полночь", deadline=day, session=session)
+    await create_task(1, "Вечер", deadline=day.replace(hour=23, minute=59), session=session)
+    await create_task(1, "Завтра", deadline=day + timedelta(days=1), session=session)
+    await create_task(1, "Без срока", session=session)
+    await create_task(2, "Чужая", deadline=day.replace(hour=12), session=session)
+
+    tasks = await get_tasks_in_range(1, day, day + timedelta(days=1), session=session)
+
+    assert [task.name for task in tasks] == ["Полночь", "Вечер"]
+
+
+@pytest.mark.asyncio
+async def test_tasks_in_range_uses_deadline_index(session):
+    if session.get_bind().dialect.name != "sqlite":
+        pytest.skip("план запроса проверяется только для SQLite")
+
+    plan = await session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM tasks "
+        "WHERE user_id = 1 AND is_completed = 0 AND deadline >= '2025-01-01' AND deadline < '2025-01-02'"
+    ))
+
+    assert "ix_tasks_user_active_deadline" in " ".join(row[-1] for row in plan)
+
+
+async def _seed_statistics(session):
+    first = await create_task(1, "Высокая", category="Работа", priority=3, session=session)
+    await create_task(1, "Низкая", category="Дом", priority=1, session=session)
+    await create_task(1, "Средняя", category="Работа", session=session)
+    done = await create_task(1, "Готово", category="Дом", priority=3, session=session)
+    await complete_task(1, done.id, session=session)
+    return first
+
+
+@pytest.mark.asyncio
+async def test_statistics_aggregates_in_sql(session):
+    await _seed_statistics(session)
+
+    stats = await get_statistics(1, session=session)
+
+    assert stats == {
+        'total': 4,
+        'completed': 1,
+        'active': 3,
+        'priorities': {1: 1, 2: 1, 3: 1},
+        'categories': {'Работа': 2, 'Дом': 1}
+    }
+
+
+@pytest.mark.asyncio
+async def test_statistics_counters_follow_mutations(session):
+    first = await _seed_statistics(session)
+
+    # первое чтение создает строку счетчиков, дальше она обновляется мутациями
+    assert (await get_statistics(1, with_categories=False, session=session))['total'] == 4
+
+    await complete_task(1, first.id, session=session)
+    await complete_task(1, first.id, session=session)
+    extra = await create_task(1, "Еще одна", priority=1, session=session)
+    await delete_task(1, extra.id, session=session)
+    await create_task(1, "Новая", priority=2, session=session)
+
+    counted = await get_statistics(1, with_categories=False, session=session)
+    aggregated = await get_statistics(1, session=session)
+
+    assert counted['priorities'] == aggregated['priorities'] == {1: 1, 2: 2, 3: 0}
+    assert (counted['total'], counted['completed'], counted['active']) == (5, 2, 3)
+    assert (aggregated['total'], aggregated['completed'], aggregated['active']) == (5, 2, 3)
+
+
+@pytest.mark.asyncio
+async def test_statistics_rebuild_keeps_concurrent_mutations(engine, session, monkeypatch):
+    first = await _seed_statistics(session)
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    # пересчет счетчиков останавливается между подсчетом и записью
+    counted, release = asyncio.Event(), asyncio.Event()
+    aggregate = requests._aggregate_statistics
+
+    async def paused_aggregate(session, tg_id):
+        stats = await aggregate(session, tg_id)
+        counted.set()
+        await release.wait()
+        return stats
+
+    monkeypatch.setattr(requests, "_aggregate_statistics", paused_aggregate)
+    async with session_pool() as reader, session_pool() as creator, session_pool() as completer:
+        rebuild = asyncio.create_task(get_statistics(1, with_categories=False, session=reader))
+        await counted.wait()
+        writes = asyncio.gather(create_task(1, "Параллельная", priority=1, session=creator),
+                                complete_task(1, first.id, session=completer))
+        await asyncio.sleep(0.2)
+        release.set()
+        await asyncio.gather(rebuild, writes)
+    monkeypatch.undo()
+
+    counted = await get_statistics(1, with_categories=False, session=session)
+    aggregated = await get_statistics(1, session=session)
+    assert (counted['total'], counted['completed'], counted['active']) == (5, 2, 3)
+    assert counted['priorities'] == aggregated['priorities'] == {1: 2, 2: 1, 3: 0}
+
+
+@pytest.mark.asyncio
+async def test_category_task_counts_single_query(engine, session):
+    await _seed_statistics(session)
+    await create_category(1, "Пустая", session=session)
+    await create_category(1, "Работа", session=session)
+    await create_category(2, "Чужая", session=session)
+
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    counts = await get_category_task_counts(1, session=session)
+
+    assert counts == {'Дом': 1, 'Пустая': 0, 'Работа': 2}
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_mutations_single_statement(engine, session):
+    tasks = [await create_task(1, f"Задача {index}", priority=index % 3 + 1, session=session)
+             for index in range(5)]
+    foreign = await create_task(2, "Чужая", session=session)
+    await complete_task(1, tasks[0].id, session=session)
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    done = await complete_tasks(1, [task.id for task in tasks[:3]] + [foreign.id], session=session)
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    assert done == {tasks[1].id: "Задача 1", tasks[2].id: "Задача 2"}
+    assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE TASKS")]) == 1
+
+    deleted = await delete_tasks(1, [tasks[0].id, tasks[3].id, foreign.id], session=session)
+    assert set(deleted) == {tasks[0].id, tasks[3].id}
+
+    counted = await get_statistics(1, with_categories=False, session=session)
+    aggregated = await get_statistics(1, session=session)
+    assert (counted['total'], counted['completed'], counted['active']) == (3, 2, 1)
+    assert counted['priorities'] == aggregated['priorities']
+
+
+@pytest.mark.asyncio
+async def test_mutations_bump_data_version(session):
+    version = get_data_version(1)
+    task = await create_task(1, "Задача", session=session)
+    assert get_data_version(1) != version
+
+    version = get_data_version(1)
+    assert await complete_task(1, task.id, session=session) == "Задача"
+    assert get_data_version(1) != version
+
+    version = get_data_version(1)
+    assert await complete_task(1, task.id, session=session) is None
+    assert await delete_task(2, task.id, session=session) is None
+    assert get_data_version(1) == version
+
+
+@pytest.mark.asyncio
+async def test_tasks_page_walks_list_in_both_directions(session):
+    deadlines = [None, None, datetime(2025, 1, 2), datetime(2025, 1, 1), datetime(2025, 1, 1)]
+    for index, deadline in enumerate(deadlines):
+        await create_task(1, f"Задача {index}", priority=2 + index % 2, deadline=deadline, session=session)
+    expected = [task.id for task in await get_user_tasks(1, session=session)]
+
+    seen, after = [], None
+    while True:
+        page = await get_tasks_page(1, after=after, page_size=2, session=session)
+        seen += [task.id for task in page.tasks]
+        if not page.has_more:
+            break
+        after = task_key(page.tasks[-1])
+
+    assert seen == expected
+
+    page = await get_tasks_page(1, before=task_key(page.tasks[0]), page_size=2, session=session)
+    assert [task.id for task in page.tasks] == expected[2:4]
+    assert page.has_more
+
+
+@pytest.mark.asyncio
+async def test_write_batcher_commits_concurrent_writes_together(engine, session):
+    batcher = enable_write_batching(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+                                    max_delay=0.05)
+    try:
+        tasks = await asyncio.gather(*(create_task(1, f"Задача {index}") for index in range(10)))
+        names = await asyncio.gather(complete_task(1, tasks[0].id), delete_task(1, tasks[1].id))
+    finally:
+        await disable_write_batching()
+
+    assert len({task.id for task in tasks}) == 10
+    assert names == ["Задача 0", "Задача 1"]
+    assert batcher.metrics.batches == 2
+    assert batcher.metrics.max_batch_size == 10
+    assert (await get_statistics(1, session=session))['total'] == 9
+
+
+@pytest.mark.asyncio
+async def test_write_batcher_isolates_failures(engine, session):
+    batcher = enable_write_batching(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+                                    max_delay=0.05)
+
+    async def broken(session, on_commit):
+        raise ValueError("сломалось")
+
+    try:
+        results = await asyncio.gather(create_task(1, "Первая"), batcher.submit(broken),
+                                       create_task(1, "Вторая"), return_exceptions=True)
+    finally:
+        await disable_write_batching()
+
+    assert isinstance(results[1], ValueError)
+    assert [result.name for result in (results[0], results[2])] == ["Первая", "Вторая"]
+    assert batcher.metrics.fallbacks == 1
+    assert len(await get_user_tasks(1, session=session)) == 2
+
+
+@pytest.mark.asyncio
+async def test_write_batcher_never_leaves_callers_waiting(engine):
+    batcher = enable_write_batching(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+                                    max_delay=0.05)
+
+    async def failing_callback(session, on_commit):
+        on_commit.append(lambda: 1 / 0)
+
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.submit(failing_callback), create_task(1, "Задача"), return_exceptions=True),
+            timeout=5)
+    finally:
+        await disable_write_batching()
+
+    # пачка закоммичена, но до результатов дело не дошло: вызывающие получают отмену, а не зависают
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_search_tasks_ranks_and_pages(session):
+    await create_task(1, "Купить тетрадь", description="для курсовой", priority=3, session=session)
+    await create_task(1, "Сдать курсовую", description="по физике", priority=1, session=session)
+    await create_task(1, "Курсовая: список литературы", priority=2, session=session)
+    await create_task(1, "Позвонить маме", session=session)
+    await create_task(2, "Чужая курсовая", session=session)
+
+    first = await search_tasks(1, "КУРС", page_size=2, session=session)
+    second = await search_tasks(1, "курс", offset=2, page_size=2, session=session)
+
+    names = [task.name for task in first.tasks + second.tasks]
+    assert first.has_more and not second.has_more
+    assert set(names[:2]) == {"Сдать курсовую", "Курсовая: список литературы"}
+    assert names[2] == "Купить тетрадь"
+    assert (await search_tasks(1, "курс физик", session=session)).tasks[0].name == "Сдать курсовую"
+    assert (await search_tasks(1, "\"*)", session=session)).tasks == []
+
+
+@pytest.mark.asyncio
+async def test_search_index_follows_updates_and_deletes(engine, session):
+    task = await create_task(1, "Старое название", session=session)
+    await session.execute(update(Task).where(Task.id == task.id).values(name="Новое название"))
+    await session.commit()
+
+    assert (await search_tasks(1, "старое", session=session)).tasks == []
+    assert [t.id for t in (await search_tasks(1, "новое", session=session)).tasks] == [task.id]
+
+    await delete_task(1, task.id, session=session)
+    assert (await search_tasks(1, "новое", session=session)).tasks == []
+
+    # REINDEX в PostgreSQL ждет, пока читающие транзакции отпустят индекс
+    await session.close()
+    await rebuild_search_index(engine)
+    assert (await search_tasks(1, "название", session=session)).tasks == []
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_completed_tasks_in_chunks(engine, session):
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    old = [await create_task(1, f"Старая {index}", category="Дом", priority=3, session=session)
+           for index in range(5)]
+    recent = await create_task(1, "Недавняя", session=session)
+    active = await create_task(1, "Активная", session=session)
+    await complete_tasks(1, [task.id for task in old] + [recent.id], session=session)
+    await session.execute(update(Task).where(Task.id.in_([task.id for task in old]))
+                          .values(completed_at=datetime.now() - timedelta(days=40)))
+    await session.commit()
+    before = await get_statistics(1, session=session)
+
+    assert await archive_completed_tasks(timedelta(days=30), chunk_size=2, max_chunks=1,
+                                         session_pool=session_pool) == 2
+    assert await archive_completed_tasks(timedelta(days=30), chunk_size=2, session_pool=session_pool) == 3
+
+    remaining = (await session.execute(select(Task.id).order_by(Task.id))).scalars().all()
+    assert remaining == [recent.id, active.id]
+    assert await session.scalar(select(func.count(TaskArchive.id))) == 5
+
+    session.expire_all()
+    _known_users.clear()
+    await session.execute(text("DELETE FROM user_stats"))
+    assert await get_statistics(1, session=session) == before
+    assert (await get_statistics(1, with_categories=False, session=session))["completed"] == 6
+
+    history = await get_task_history(1, session=session)
+    assert [entry.name for entry in history][0] == "Недавняя"
+    assert len(history) == 6 and history[-1].category == "Дом"
+
+
+@pytest.mark.asyncio
+async def test_read_paths_return_rows_without_orm_objects(session):
+    await create_task(1, "Отчет", description="квартальный", category="Работа", priority=3,
+                      deadline=datetime.now() + timedelta(hours=1), session=session)
+    await create_task(1, "Хлеб", session=session)
+    session.expunge_all()
+
+    tasks = await get_user_tasks(1, session=session)
+    by_category = await get_tasks_by_category(1, "Работа", session=session)
+    found = (await search_tasks(1, "отчет", session=session)).tasks
+
+    assert all(isinstance(task, TaskRow) for task in tasks + by_category + found)
+    assert tasks[0] == by_category[0] == found[0]
+    assert (tasks[0].name, tasks[0].category, tasks[1].category) == ("Отчет", "Работа", None)
+    assert len(session.identity_map) == 0
@@ -0,0 +1,58 @@
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.handlers import CreateTask
+from bot.storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+@pytest.fixture
+def session_pool(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(session_pool):
+    storage = SQLiteStorage(session_pool)
+    await storage.set_state(KEY, CreateTask.priority)
+    await storage.update_data(KEY, {"name": "Задача", "description": "Описание"})
+    await storage.close()
+
+    restarted = SQLiteStorage(session_pool)
+
+    assert await restarted.get_state(KEY) == CreateTask.priority.state
+    assert await restarted.get_data(KEY) == {"name": "Задача", "description": "Описание"}
+
+
+@pytest.mark.asyncio
+async def test_updates_are_coalesced_into_one_flush(engine, session_pool):
+    storage = SQLiteStorage(session_pool, flush_interval=60)
+    await storage.get_state(KEY)
+
+    writes = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: writes.append(statement)
+                 if statement.startswith("INSERT") else None)
+
+    await storage.set_state(KEY, CreateTask.name)
+    for field in ("name", "description", "category", "priority"):
+        await storage.update_data(KEY, {field: field})
+    assert writes == []
+
+    await storage.close()
+    assert len(writes) == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_flows_expire(session_pool):
+    storage = SQLiteStorage(session_pool, ttl=0)
+    await storage.set_state(KEY, CreateTask.name)
+    await storage.flush()
+
+    await storage.evict_expired()
+    await storage.close()
+
+    assert await SQLiteStorage(session_pool).get_state(KEY) is None
@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, InlineQuery, Message, Update
+
+from bench.replay import StubSession
+from bot.throttling import DB_HEAVY, FloodControlMiddleware, db_slot
+
+
+def message_update(bot, update_id, user_id=10, text="Список задач"):
+    return Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 1700000000, "text": text,
+        "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+        "chat": {"id": user_id, "type": "private"}}}, context={"bot": bot})
+
+
+def callback_update(bot, update_id, user_id=10, data="stats"):
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "Тест"}}}, context={"bot": bot})
+
+
+def inline_update(bot, update_id, user_id=10, query="куп"):
+    return Update.model_validate({"update_id": update_id, "inline_query": {
+        "id": str(update_id), "query": query, "offset": "",
+        "from": {"id": user_id, "is_bot": False, "first_name": "Тест"}}}, context={"bot": bot})
+
+
+def make_dispatcher(router, **limits):
+    dp = Dispatcher()
+    dp.include_router(router)
+    middleware = FloodControlMiddleware(**limits)
+    middleware.setup(dp)
+    session = StubSession()
+    return dp, middleware, Bot(token="42:TEST", session=session), session
+
+
+@pytest.mark.asyncio
+async def test_flood_control_drops_updates_over_limit():
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def list_tasks(message: Message):
+        handled.append(message.message_id)
+
+    dp, middleware, bot, session = make_dispatcher(router, rate=0.001, burst=2)
+    for update_id in range(1, 5):
+        await dp.feed_update(bot, message_update(bot, update_id))
+    await dp.feed_update(bot, message_update(bot, 5, user_id=11))
+
+    assert handled == [1, 2, 5]
+    assert middleware.metrics.throttled == 2
+    # предупреждение отправляется один раз за серию
+    assert session.calls["sendMessage"] == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_callbacks_share_one_run():
+    runs = []
+    release = asyncio.Event()
+    router = Router()
+
+    @router.callback_query(F.data == "stats")
+    async def stats_inline(callback: CallbackQuery):
+        runs.append(callback.id)
+        await release.wait()
+        await callback.answer()
+        return "готово"
+
+    dp, middleware, bot, session = make_dispatcher(router)
+    first = asyncio.create_task(dp.feed_update(bot, callback_update(bot, 1)))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(dp.feed_update(bot, callback_update(bot, 2)))
+    other = asyncio.create_task(dp.feed_update(bot, callback_update(bot, 3, user_id=11)))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await asyncio.gather(first, second, other) == ["готово", "готово", "готово"]
+    assert runs == ["1", "3"]
+    assert middleware.metrics.collapsed == 1
+    assert session.calls["answerCallbackQuery"] == 3
+
+
+@pytest.mark.asyncio
+async def test_heavy_handlers_share_db_semaphore_only_while_loading():
+    running = []
+    peak = []
+    replied = asyncio.Event()
+    router = Router()
+
+    @router.message(F.text == "Список задач", flags=DB_HEAVY)
+    async def list_tasks(message: Message):
+        async with db_slot():
+            running.append(message.message_id)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(message.message_id)
+        # ответ в Telegram идет уже без слота: зависший ответ не держит остальных
+        if message.message_id == 1:
+            await replied.wait()
+
+    @router.message()
+    async def light(message: Message):
+        async with db_slot():
+            peak.append(-1)
+
+    dp, middleware, bot, _ = make_dispatcher(router, db_concurrency=1)
+    first = asyncio.create_task(dp.feed_update(bot, message_update(bot, 1, user_id=1)))
+    await asyncio.gather(*(dp.feed_update(bot, message_update(bot, index, user_id=index))
+                           for index in range(2, 4)),
+                         dp.feed_update(bot, message_update(bot, 4, user_id=4, text="привет")))
+    assert not first.done()
+    replied.set()
+    await first
+
+    assert sorted(peak) == [-1, 1, 1, 1]
+    assert middleware.metrics.db_waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_inline_queries_bypass_user_bucket():
+    handled = []
+    router = Router()
+
+    @router.inline_query()
+    async def inline_tasks(inline_query: InlineQuery):
+        handled.append(inline_query.id)
+
+    dp, middleware, bot, _ = make_dispatcher(router, rate=0.001, burst=1)
+    for update_id in range(1, 6):
+        await dp.feed_update(bot, inline_update(bot, update_id, query="куп"[:update_id]))
+
+    assert handled == ["1", "2", "3", "4", "5"]
+    assert middleware.metrics.throttled == 0
+    # и не съедают ведро для обычных сообщений
+    await dp.feed_update(bot, message_update(bot, 6))
+    assert middleware.metrics.throttled == 0
+
+
+def test_user_buckets_are_bounded_and_evicted_when_idle(monkeypatch):
+    middleware = FloodControlMiddleware(max_users=2, idle_ttl=60)
+    for user_id in range(3):
+        assert middleware.allow(user_id)
+    assert middleware.tracked_users == 2
+
+    later = time.monotonic() + 120
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert middleware.allow(5)
+    assert middleware.tracked_users == 1
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import SECRET_HEADER, WebhookServer
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 7,
+        "date": 1700000000,
+        "chat": {"id": 10, "type": "private"},
+        "from": {"id": 10, "is_bot": False, "first_name": "Тест"},
+        "text": "Список задач"
+    }
+}
+
+
+@pytest.fixture
+def received():
+    return []
+
+
+@pytest.fixture
+def dispatcher(received):
+    router = Router()
+
+    @router.message()
+    async def record(message: Message):
+        received.append(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+@pytest.mark.asyncio
+async def test_webhook_accepts_update_with_secret(dispatcher, received):
+    server = WebhookServer(dispatcher, Bot(token="42:TEST"), "secret", workers=2)
+
+    async with TestClient(TestServer(server.make_app())) as client:
+        response = await client.post("/webhook", json=UPDATE, headers={SECRET_HEADER: "secret"})
+        assert response.status == 200
+
+        await asyncio.wait_for(server.queue.join(), timeout=1)
+
+    assert received == ["Список задач"]
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_wrong_secret_and_bad_payload(dispatcher, received):
+    server = WebhookServer(dispatcher, Bot(token="42:TEST"), "secret", workers=2)
+
+    async with TestClient(TestServer(server.make_app())) as client:
+        response = await client.post("/webhook", json=UPDATE, headers={SECRET_HEADER: "wrong"})
+        assert response.status == 401
+
+        response = await client.post("/webhook", data="not json", headers={SECRET_HEADER: "secret"})
+        assert response.status == 400
+
+    assert received == []